@@ -1,5 +1,5 @@
 import streamlit as st 
-from paginas.funcoes import inicializar_firebase, obter_perfil_usuario, atualizar_perfil_usuario, login_usuario, registrar_acao_usuario
+from paginas.funcoes import inicializar_firebase, obter_perfil_usuario, atualizar_perfil_usuario, login_usuario, registrar_acao_usuario, descarregar_logs
 import os # Importar os
 
 # Inicializa o Firebase
@@ -158,6 +158,7 @@ else:
                          icon=':material/logout:',
                          use_container_width=True):
                 registrar_acao_usuario("Logout", "Usuário fez logout do sistema (botão global)")
+                descarregar_logs() # Grava os logs pendentes da sessão antes de sair
                 st.logout()
 
     else: # Caso o perfil não possa ser carregado após o login
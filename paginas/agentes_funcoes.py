@@ -1,37 +1,176 @@
 import streamlit as st
 import json
 import firebase_admin
-import PyPDF2
 import io
-from openai import OpenAI 
-from paginas.funcoes import COLECAO_USUARIOS
+import hashlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from paginas.funcoes import COLECAO_USUARIOS, obter_db, registrar_resumo_exame, baixar_arquivos, gravar_arquivo_cache, ler_arquivo_cache, extrair_texto_pdf
+from paginas.llms import obter_cliente_openai
 from firebase_admin import firestore, credentials, storage
 
 
+# Threads que analisam exames em segundo plano (leitura do PDF + chamada ao modelo)
+INGESTAO_EXAMES_THREADS = 4
+
+# Modelo usado pelo relator e versão do seu prompt/esquema: ambos fazem parte da chave
+# do cache de resultados, então alterar os prompts ou a divisão em grupos exige incrementar a versão
+MODELO_RELATOR = 'gpt-4o-mini'
+VERSAO_PROMPT_RELATOR = 2
+
+# Laudos longos são divididos em grupos de páginas resumidos em paralelo (map) e
+# depois estruturados a partir dos resumos (reduce). Tokens estimados por caracteres
+CARACTERES_POR_TOKEN = 4
+TOKENS_POR_GRUPO_PAGINAS = 4000      # Tamanho máximo de cada grupo (e de um laudo lido de uma vez)
+TOKENS_RESUMO_GRUPO = 500            # Tamanho máximo do resumo de cada grupo
+ORCAMENTO_TOKENS_EXAME = 40000       # Máximo de texto do laudo enviado ao modelo; o restante é ignorado
+RELATOR_CHAMADAS_SIMULTANEAS = 4
+
+PROMPT_RESUMO_PAGINAS = """Você recebe algumas páginas de um laudo de exame veterinário.
+Resuma de forma objetiva apenas o que está nessas páginas: data do exame, tipo de exame,
+resultados e valores relevantes (com unidades e valores de referência, quando houver) e conclusões.
+Não adicione nenhuma informação que não esteja explicitamente no texto.
+"""
+
+def _chave_cache_relator(texto):
+    """
+    Chave do resultado do relator no cache local de arquivos: hash do texto
+    extraído do exame, do modelo e da versão do prompt.
+    """
+    dados = json.dumps([texto, MODELO_RELATOR, VERSAO_PROMPT_RELATOR], ensure_ascii=False)
+    return f"relator:{hashlib.sha256(dados.encode('utf-8')).hexdigest()}"
+
+
+def _agrupar_paginas(paginas):
+    """
+    Junta páginas consecutivas em grupos de até TOKENS_POR_GRUPO_PAGINAS, sem passar
+    de ORCAMENTO_TOKENS_EXAME no total. Páginas maiores que um grupo são divididas.
+
+    Args:
+        - paginas: lista com o texto de cada página
+
+    Returns:
+        Lista de tuplas (primeira página, última página, texto), páginas numeradas a partir de 1
+    """
+    limite_grupo = TOKENS_POR_GRUPO_PAGINAS * CARACTERES_POR_TOKEN
+    restante = ORCAMENTO_TOKENS_EXAME * CARACTERES_POR_TOKEN
+    grupos = []
+    atual = None
+
+    for numero, texto in enumerate(paginas, 1):
+        if restante <= 0:
+            print(f"Orçamento de tokens do exame atingido: páginas a partir da {numero} não serão analisadas")
+            break
+        texto = texto[:restante]
+        restante -= len(texto)
+
+        for inicio in range(0, len(texto), limite_grupo):
+            trecho = texto[inicio:inicio + limite_grupo]
+            if atual is not None and len(atual[2]) + len(trecho) <= limite_grupo:
+                atual[1] = numero
+                atual[2] += trecho
+            else:
+                atual = [numero, numero, trecho]
+                grupos.append(atual)
+
+    return [tuple(grupo) for grupo in grupos]
+
+
+def _resumir_grupo_paginas(client, grupo):
+    """
+    Etapa map: resume um grupo de páginas do laudo em texto curto.
+
+    Returns:
+        Resumo precedido das páginas de origem
+    """
+    primeira, ultima, texto = grupo
+    resposta = client.chat.completions.create(
+        model = MODELO_RELATOR,
+        messages = [{'role': 'system', 'content': PROMPT_RESUMO_PAGINAS},
+                    {'role': 'user', 'content': texto}],
+        max_tokens = TOKENS_RESUMO_GRUPO
+    )
+    paginas = f"Página {primeira}" if primeira == ultima else f"Páginas {primeira} a {ultima}"
+    return f"{paginas}:\n{resposta.choices[0].message.content}"
+
+
 # Função para ler os exames e extrair informações mais importantes
 
-def relator(pet_id, exame_doc_id, pdf):
+def relator(pet_id, exame_doc_id, pdf=None, url_pdf=None, email=None, ao_progredir=None):
     
     """
     Estrutura as informações obrigatórias e opcionais do exame:
     data, tipo, resultado e mini-relatório (opcional)
+    
+    Cada etapa (extraindo, analisando, salvando, concluido) é gravada no campo
+    `status` do documento do exame; em caso de falha o status vira "erro" e a
+    mensagem fica em `erro_analise`. Não usa a sessão do Streamlit quando `email`
+    é informado, podendo rodar em segundo plano (ver enviar_exame_para_analise).
 
     Args:
         - pet_id: id do respectivo pet
         - exame_doc_id: id do documento do respectivo exame
         - pdf: arquivo pdf presente na memória do streamlit
+        - url_pdf: URL do pdf no Storage, lida pelo cache local quando `pdf` não é informado
+        - email: email do usuário dono do pet (padrão: usuário logado)
+        - ao_progredir: função opcional chamada com o nome de cada etapa
+    
+    Returns:
+        True se o exame foi analisado, ou uma mensagem de erro
     """
-    # Extraindo o texto dos pdfs
-    texto = ""
+    email = email or st.user.email
+    ao_progredir = ao_progredir or (lambda etapa: None)
+    
+    db = obter_db()
+    exames_doc = db.collection(COLECAO_USUARIOS).document(email).collection("pets").document(pet_id).collection("exames").document(exame_doc_id)
+    
+    def avancar(etapa, **campos):
+        exames_doc.update({"status": etapa, "status_atualizado_em": datetime.now(), **campos})
+        ao_progredir(etapa)
+    
+    def falhar(mensagem):
+        print(mensagem)
+        try:
+            avancar("erro", erro_analise=mensagem)
+        except Exception as e:
+            print(f"Erro ao registrar a falha do exame {exame_doc_id}: {e}")
+        return mensagem
+    
+    def salvar(saida):
+        try:
+            print(saida)
+            avancar("salvando")
+            exames_doc.set({**saida, "status": "concluido", "status_atualizado_em": datetime.now(), "data_atualizacao": datetime.now()}, merge=True)
+            
+            # O resumo do usuário ordena os exames pela data de upload, não pela data da análise
+            data_upload = (exames_doc.get(field_paths=["data_upload"]).to_dict() or {}).get("data_upload")
+            registrar_resumo_exame(email, pet_id, exame_doc_id, saida, data_upload=data_upload)
+            ao_progredir("concluido")
+            return True
+        except Exception as e:
+            return falhar(f"Erro ao extrair informações do exame: {e}")
+    
+    avancar("extraindo")
+    if pdf is None:
+        conteudo = baixar_arquivos([url_pdf]).get(url_pdf)
+        if conteudo is None:
+            return falhar("Erro ao obter o pdf do exame")
+        pdf = io.BytesIO(conteudo)
+
+    # Extraindo o texto dos pdfs, página por página
     try:
         pdf.seek(0)
-        leitor = PyPDF2.PdfReader(pdf)
-        for pagina in leitor.pages:
-            texto_pagina = pagina.extract_text()
-            if texto_pagina:
-                texto += texto_pagina
+        paginas = extrair_texto_pdf(pdf.read())
+        texto = "".join(paginas)
     except Exception as erro:
-        return f"Erro ao extrair o texto do pdf: {erro}"
+        return falhar(f"Erro ao extrair o texto do pdf: {erro}")
+
+    # Mesmo laudo já analisado (reenvio ou outro pet): reaproveita o resultado sem chamar o modelo.
+    # PDFs sem texto (digitalizados, só imagem) teriam todos a mesma chave e nunca usam o cache
+    chave_cache = _chave_cache_relator(texto) if texto.strip() else None
+    em_cache = ler_arquivo_cache(chave_cache) if chave_cache else None
+    if em_cache is not None:
+        return salvar(json.loads(em_cache))
 
     # Definindo o prompt para o agente
     prompt = """Você é um agente de IA treinado para ler, extrair e interpretar informações de laudos de exames veterinários.
@@ -41,9 +180,8 @@ def relator(pet_id, exame_doc_id, pdf):
     Se qualquer um dos campos obrigatórios não puderem ser encontrados, seus respectivos valores no JSON devem ser a string 'Não encontrado'.
     """
 
-    # Criando o modelo
-    openai_api_key = st.secrets['OPENAI_API_KEY']
-    client = OpenAI(api_key=openai_api_key)
+    # Cliente OpenAI compartilhado
+    client = obter_cliente_openai()
 
     # Definindo o esquema para o output estruturado
 
@@ -75,36 +213,76 @@ def relator(pet_id, exame_doc_id, pdf):
     }
     
     # Definindo o modelo com os respectivos argumentos
-    resposta = client.chat.completions.create(
-        model = 'gpt-4o-mini',
-
-        # Direciona o agente com as instruções
-        messages = [{'role': 'system', 'content' : prompt},
-                    {'role': 'user', 'content': texto}],
-    
-        # Garante o formato JSON ao final 
-        response_format={
-        "type": "json_schema",
-        "json_schema": {
-            "name": "exame_schema",  # <- ESSA LINHA É O QUE FALTAVA
-            "schema": esquema["schema"],
-            "strict": esquema["strict"]
-        }
-        }
-        )
+    avancar("analisando")
+    try:
+        # Laudo curto segue inteiro; laudo longo é resumido por grupos de páginas em paralelo
+        grupos = _agrupar_paginas(paginas)
+        if len(grupos) <= 1:
+            conteudo = grupos[0][2] if grupos else texto
+        else:
+            with ThreadPoolExecutor(max_workers=min(RELATOR_CHAMADAS_SIMULTANEAS, len(grupos))) as executor:
+                resumos = list(executor.map(lambda grupo: _resumir_grupo_paginas(client, grupo), grupos))
+            conteudo = "Resumos das páginas do laudo:\n\n" + "\n\n".join(resumos)
 
-    # Saída em formato de texto, objetivando JSON
-    saida = json.loads(resposta.choices[0].message.content)
+        resposta = client.chat.completions.create(
+            model = MODELO_RELATOR,
 
-    db = firestore.client()
-    exames_doc = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("pets").document(pet_id).collection("exames").document(exame_doc_id)
+            # Direciona o agente com as instruções
+            messages = [{'role': 'system', 'content' : prompt},
+                        {'role': 'user', 'content': conteudo}],
+        
+            # Garante o formato JSON ao final 
+            response_format={
+            "type": "json_schema",
+            "json_schema": {
+                "name": "exame_schema",  # <- ESSA LINHA É O QUE FALTAVA
+                "schema": esquema["schema"],
+                "strict": esquema["strict"]
+            }
+            }
+            )
 
-    try:
-        print(saida)
-        exames_doc.set(saida, merge=True)
-        return True
+        # Saída em formato de texto, objetivando JSON
+        saida = json.loads(resposta.choices[0].message.content)
     except Exception as e:
-        return f"Erro ao extrair informações do exame: {e}"
+        return falhar(f"Erro ao analisar o exame: {e}")
+
+    if chave_cache:
+        gravar_arquivo_cache(chave_cache, json.dumps(saida, ensure_ascii=False).encode("utf-8"))
+    return salvar(saida)
+
+
+@st.cache_resource(show_spinner=False)
+def _obter_executor_ingestao():
+    """
+    Pool de threads do processo para as análises de exames em segundo plano.
+    """
+    return ThreadPoolExecutor(max_workers=INGESTAO_EXAMES_THREADS, thread_name_prefix="ingestao_exames")
+
+def enviar_exame_para_analise(pet_id, exame_doc_id, pdf_bytes=None, url_pdf=None, ao_progredir=None):
+    """
+    Agenda o relator em segundo plano para um exame recém-enviado (ou cuja análise
+    falhou ou foi interrompida), liberando a interface imediatamente.
+
+    Args:
+        - pet_id: id do respectivo pet
+        - exame_doc_id: id do documento do respectivo exame
+        - pdf_bytes: conteúdo do pdf já enviado ao Storage (opcional)
+        - url_pdf: URL do pdf no Storage, usada quando pdf_bytes não é informado
+        - ao_progredir: função opcional chamada (na thread da análise) com cada etapa
+
+    Returns:
+        Future com o retorno do relator (True ou mensagem de erro)
+    """
+    return _obter_executor_ingestao().submit(
+        relator,
+        pet_id,
+        exame_doc_id,
+        pdf=io.BytesIO(pdf_bytes) if pdf_bytes is not None else None,
+        url_pdf=url_pdf,
+        email=st.user.email,
+        ao_progredir=ao_progredir
+    )
 
 
 def analisador_saude_pet(pet_data, exames_data):
@@ -168,9 +346,8 @@ def analisador_saude_pet(pet_data, exames_data):
     """
     
     try:
-        # Criando o modelo OpenAI
-        openai_api_key = st.secrets['OPENAI_API_KEY']
-        client = OpenAI(api_key=openai_api_key)
+        # Cliente OpenAI compartilhado
+        client = obter_cliente_openai()
         
         # Esquema para output estruturado
         esquema = {
@@ -272,7 +449,7 @@ def gerar_secao_interpretacao_tecnica(pet_id):
     
     try:
         print("🔥 Conectando ao Firestore...")
-        db = firestore.client()
+        db = obter_db()
         print("✅ Firestore conectado!")
         
         # Verifica se o usuário está logado
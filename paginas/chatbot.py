@@ -1,5 +1,4 @@
 import streamlit as st
-from openai import OpenAI 
 from paginas.funcoes import (
     obter_perfil_usuario, 
     registrar_acao_usuario, 
@@ -9,11 +8,11 @@ from paginas.funcoes import (
     obter_chat, 
     excluir_chat,
     atualizar_chat,
+    obter_mensagens_anteriores,
     login_usuario,
-    obter_pets,
     obter_info_exames
 )
-from paginas.llms import gerar_titulo_chat
+from paginas.llms import gerar_titulo_chat, obter_cliente_openai, medir_cache_prompt
 from datetime import datetime
 
 # Verifica se o usuário está logado
@@ -50,9 +49,8 @@ if st.session_state.get('show_welcome_message', False):
     # Remove o flag para não mostrar novamente
     del st.session_state['show_welcome_message']
 
-# Configurações iniciais
-openai_api_key = st.secrets["OPENAI_API_KEY"]
-client = OpenAI(api_key=openai_api_key)
+# Configurações iniciais (cliente OpenAI compartilhado pelo processo)
+client = obter_cliente_openai()
 
 # Função para obter avatar do usuário
 def obter_avatar_usuario():
@@ -82,27 +80,15 @@ avatar_assistant = 'arquivos/peluno.png'
 MENSAGEM_INICIAL = obter_mensagem_inicial()
 
 # Gera o resumo de informações de exames de cada pet
-pets = obter_pets()
-contexto_exames = obter_info_exames(pets)
-
-def obter_system_prompt(perfil):
-    """Gera o system prompt personalizado para Dr. Peluno"""
-    return f"""
+contexto_exames = obter_info_exames()
 
+# System prompt fixo do Dr. Peluno: idêntico, byte a byte, para todos os usuários e
+# conversas, para que o cache automático de prefixo do provedor o reaproveite.
+# Os dados do usuário vão em uma mensagem separada, logo depois (obter_contexto_usuario)
+SYSTEM_PROMPT_DR_PELUNO = """
 **PERSONA:** Você é o Dr. Peluno, um especialista veterinário virtual caloroso, experiente e dedicado. Profissional competente, bem-humorado e acolhedor. Fala em português-BR, frases curtas, **negrito** para destaques e máx. *dois emojis* por mensagem.
 
-INFORMAÇÕES DO USUÁRIO:
-- Nome: {perfil.get('nome_completo', 'Não informado')}
-- Idade: {perfil.get('idade', 'Não informada')}
-- Experiência com Pets: {perfil.get('experiencia_pets', 'Não informada')}
-- Tipos de Pets: {perfil.get('tipos_pets', 'Não informado')}
-- Situação Atual: {perfil.get('situacao_atual', 'Não informada')}
-
-INFORMAÇÕES DOS PETS:
-{perfil['resumos_pet']}
-
-INFORMAÇÕES DOS EXAMES DE CADA PET:
-{contexto_exames}
+As informações do usuário, dos seus pets e dos exames de cada pet estão na mensagem de contexto que vem logo após estas instruções.
 
 ## 2. Missão
 
@@ -150,6 +136,22 @@ Durante uma conversa **natural e acolhedora**, ajude o usuário com questões so
 Seja o Dr. Peluno, um especialista veterinário virtual dedicado e empático. Ajude com **orientações gerais, comportamento, cuidados básicos e prevenção**. Sempre priorize o bem-estar animal e oriente para cuidados profissionais quando necessário. 
 """
 
+def obter_contexto_usuario(perfil):
+    """Gera o bloco de contexto do usuário, enviado depois do system prompt fixo"""
+    return f"""INFORMAÇÕES DO USUÁRIO:
+- Nome: {perfil.get('nome_completo', 'Não informado')}
+- Idade: {perfil.get('idade', 'Não informada')}
+- Experiência com Pets: {perfil.get('experiencia_pets', 'Não informada')}
+- Tipos de Pets: {perfil.get('tipos_pets', 'Não informado')}
+- Situação Atual: {perfil.get('situacao_atual', 'Não informada')}
+
+INFORMAÇÕES DOS PETS:
+{perfil['resumos_pet']}
+
+INFORMAÇÕES DOS EXAMES DE CADA PET:
+{contexto_exames}
+"""
+
 # Inicialização do histórico de mensagens e chat ativo
 if 'mensagens' not in st.session_state:
     st.session_state.mensagens = [
@@ -165,6 +167,30 @@ if 'chat_ativo_id' not in st.session_state:
 if 'chat_ativo_nome' not in st.session_state:
     st.session_state.chat_ativo_nome = "Nova Conversa"
 
+# Controle das mensagens já gravadas no Firestore (salvamento incremental)
+# - chat_total_mensagens: quantidade de mensagens salvas na conversa inteira
+# - chat_mensagens_salvas: quantas mensagens de st.session_state.mensagens já estão salvas
+# - chat_primeira_ordem: posição da mensagem mais antiga carregada na tela
+if 'chat_total_mensagens' not in st.session_state:
+    st.session_state.chat_total_mensagens = 0
+    st.session_state.chat_mensagens_salvas = 0
+    st.session_state.chat_primeira_ordem = 0
+
+# Lista de conversas da barra lateral, carregada por páginas e mantida na sessão;
+# recarregada se outro usuário entrar na mesma sessão
+if st.session_state.get('chats_sidebar_usuario') != getattr(st.user, 'email', None):
+    st.session_state.chats_sidebar, st.session_state.chats_cursor = obter_chats()
+    st.session_state.chats_sidebar_usuario = getattr(st.user, 'email', None)
+
+def mover_chat_para_topo(chat_id, nome):
+    """Coloca a conversa no topo da lista da barra lateral sem consultar o Firestore"""
+    chats_restantes = [chat for chat in st.session_state.chats_sidebar if chat['id'] != chat_id]
+    st.session_state.chats_sidebar = [{
+        "id": chat_id,
+        "nome": nome,
+        "data_atualizacao": datetime.now()
+    }] + chats_restantes
+
 # Cabeçalho com apresentação do Dr. Peluno
 st.markdown("""
 <style>
@@ -217,11 +243,14 @@ with st.sidebar:
         ]
         st.session_state.chat_ativo_id = None
         st.session_state.chat_ativo_nome = "Nova Conversa"
+        st.session_state.chat_total_mensagens = 0
+        st.session_state.chat_mensagens_salvas = 0
+        st.session_state.chat_primeira_ordem = 0
         registrar_acao_usuario("Nova Conversa", "Usuário iniciou nova conversa com Dr. Peluno")
         st.rerun()
     
     # Exibir chats existentes
-    chats = obter_chats() 
+    chats = st.session_state.chats_sidebar
     
     if len(chats) == 0:
         st.info("Você ainda não tem conversas salvas! 🐾")
@@ -235,11 +264,15 @@ with st.sidebar:
                     st.session_state.mensagens = chat_data['mensagens']
                     st.session_state.chat_ativo_id = chat['id']
                     st.session_state.chat_ativo_nome = chat['nome']
+                    st.session_state.chat_total_mensagens = chat_data['total_mensagens']
+                    st.session_state.chat_mensagens_salvas = len(chat_data['mensagens'])
+                    st.session_state.chat_primeira_ordem = chat_data['primeira_ordem']
                     registrar_acao_usuario("Abrir Conversa", f"Usuário abriu a conversa {chat['nome']}")
                     st.rerun()
         with col2:
             if st.button("🗑️", key=f"excluir_{chat['id']}"):
-                excluir_chat(chat['id'])
+                if excluir_chat(chat['id']):
+                    st.session_state.chats_sidebar = [c for c in chats if c['id'] != chat['id']]
                 registrar_acao_usuario("Excluir Conversa", f"Usuário excluiu a conversa {chat['nome']}")
                 # Se o chat excluído for o ativo, iniciar um novo chat
                 if st.session_state.chat_ativo_id == chat['id']:
@@ -252,7 +285,28 @@ with st.sidebar:
                     ]
                     st.session_state.chat_ativo_id = None
                     st.session_state.chat_ativo_nome = "Nova Conversa"
+                    st.session_state.chat_total_mensagens = 0
+                    st.session_state.chat_mensagens_salvas = 0
+                    st.session_state.chat_primeira_ordem = 0
                 st.rerun()
+    
+    # Carrega a próxima página de conversas a partir do cursor
+    if st.session_state.chats_cursor is not None:
+        if st.button("Carregar mais conversas", key="carregar_mais_chats", use_container_width=True, type="tertiary"):
+            mais_chats, st.session_state.chats_cursor = obter_chats(cursor=st.session_state.chats_cursor)
+            st.session_state.chats_sidebar = chats + mais_chats
+            st.rerun()
+
+# Conversas longas são abertas só com as mensagens mais recentes
+if st.session_state.chat_ativo_id and st.session_state.chat_primeira_ordem > 0:
+    if st.button("⬆️ Carregar mensagens anteriores", key="carregar_mensagens_anteriores", type="tertiary"):
+        anteriores, st.session_state.chat_primeira_ordem = obter_mensagens_anteriores(
+            st.session_state.chat_ativo_id,
+            antes_de=st.session_state.chat_primeira_ordem
+        )
+        st.session_state.mensagens = anteriores + st.session_state.mensagens
+        st.session_state.chat_mensagens_salvas += len(anteriores)
+        st.rerun()
 
 # Exibição do histórico de mensagens
 for mensagem in st.session_state.mensagens:
@@ -303,11 +357,11 @@ if prompt:
     # Processa resposta do Dr. Peluno
     with st.chat_message("assistant", avatar=avatar_assistant):
         try:
-            # Prepara o sistema prompt personalizado para Dr. Peluno
-            system_prompt = obter_system_prompt(perfil)
-
-            # Prepara mensagens para a API
-            messages = [{"role": "system", "content": system_prompt}]
+            # Prepara mensagens para a API: prompt fixo primeiro (prefixo em cache), depois o contexto do usuário
+            messages = [
+                {"role": "system", "content": SYSTEM_PROMPT_DR_PELUNO},
+                {"role": "system", "content": obter_contexto_usuario(perfil)}
+            ]
             
             # Adiciona apenas as últimas 10 mensagens para manter contexto sem ultrapassar limites
             recent_messages = st.session_state.mensagens[-10:]
@@ -324,18 +378,26 @@ if prompt:
                 messages=messages,
                 temperature=0.8,  # Um pouco mais criativa para conselhos amorosos
                 max_tokens=1000,
-                stream=True
+                stream=True,
+                stream_options={"include_usage": True}  # Uso de tokens no último chunk
             )
             
             # Exibe resposta em tempo real
             resposta_completa = ""
+            uso = None
             container = st.empty()
             
             for chunk in resposta_stream:
-                if chunk.choices[0].delta.content is not None:
+                # O último chunk traz apenas o uso de tokens, sem choices
+                if chunk.usage is not None:
+                    uso = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content is not None:
                     resposta_completa += chunk.choices[0].delta.content
                     container.markdown(resposta_completa + "▌")
             
+            # Proporção do prompt atendida pelo cache de prefixo
+            uso_tokens = medir_cache_prompt(uso, "Dr. Peluno")
+            
             # Remove o cursor e mostra resposta final
             container.markdown(resposta_completa)
             
@@ -361,10 +423,17 @@ if prompt:
                 if chat_id:
                     st.session_state.chat_ativo_id = chat_id
                     st.session_state.chat_ativo_nome = titulo
+                    st.session_state.chat_total_mensagens = len(st.session_state.mensagens)
+                    st.session_state.chat_mensagens_salvas = len(st.session_state.mensagens)
+                    mover_chat_para_topo(chat_id, titulo)
                     registrar_acao_usuario("Nova Conversa Salva", f"Conversa salva automaticamente: {titulo}")
             else:
-                # Atualiza conversa existente
-                atualizar_chat(st.session_state.chat_ativo_id, st.session_state.mensagens)
+                # Atualiza conversa existente gravando apenas as mensagens ainda não salvas
+                novas_mensagens = st.session_state.mensagens[st.session_state.chat_mensagens_salvas:]
+                if atualizar_chat(st.session_state.chat_ativo_id, novas_mensagens, inicio=st.session_state.chat_total_mensagens):
+                    st.session_state.chat_total_mensagens += len(novas_mensagens)
+                    st.session_state.chat_mensagens_salvas = len(st.session_state.mensagens)
+                    mover_chat_para_topo(st.session_state.chat_ativo_id, st.session_state.chat_ativo_nome)
                 registrar_acao_usuario("Conversa Atualizada", f"Conversa {st.session_state.chat_ativo_nome} atualizada")
             
             # Registra a resposta
@@ -375,7 +444,8 @@ if prompt:
                     "acao": "resposta",
                     "tamanho_resposta": len(resposta_completa),
                     "chat_id": st.session_state.chat_ativo_id,
-                    "chat_nome": st.session_state.chat_ativo_nome
+                    "chat_nome": st.session_state.chat_ativo_nome,
+                    **uso_tokens
                 }
             )
             
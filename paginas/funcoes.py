@@ -1,54 +1,164 @@
-from datetime import date, datetime
+from datetime import date, datetime, timedelta, timezone
 from dateutil.relativedelta import relativedelta
 import streamlit as st
 from firebase_admin import firestore, credentials, storage
 import firebase_admin
 import uuid
-from PIL import Image
+import time
+import threading
+import atexit
+import copy
+import os
+import hashlib
+import tempfile
+import shutil
+import json
+import re
+import functools
+from PIL import Image, ImageOps, features
 import io
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as ReportLabImage
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, Image as ReportLabImage
 from reportlab.lib import colors
 from reportlab.lib.utils import ImageReader
 import requests
 from pypdf import PdfReader, PdfWriter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, CancelledError, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import zipfile
+from requests.adapters import HTTPAdapter
 
 # Nome da coleção principal de usuários definida como variável global
 COLECAO_USUARIOS = "Dr-Tobias"
 
+# Número máximo de consultas ao Firestore disparadas em paralelo pelo painel de pets
+MAX_CONSULTAS_SIMULTANEAS = 8
 
+# Tempo de vida (em segundos) das leituras guardadas no cache da sessão
+CACHE_TTL_SEGUNDOS = 300
 
-def inicializar_firebase():
+# Intervalo mínimo (em segundos) entre duas gravações de 'ultimo_acesso' na mesma sessão
+INTERVALO_ULTIMO_ACESSO_SEGUNDOS = 300
+
+# Quantidade de conversas carregadas por vez na barra lateral do chat
+CHATS_POR_PAGINA = 20
+
+# Quantidade de mensagens carregadas por vez ao abrir uma conversa
+MENSAGENS_POR_PAGINA = 30
+
+# Limite de operações por escrita em lote do Firestore
+LIMITE_OPERACOES_LOTE = 500
+
+# Logs e atividades são gravados em lote quando o buffer atinge este tamanho
+# ou, no máximo, após este intervalo (em segundos)
+LOGS_TAMANHO_LOTE = 20
+LOGS_INTERVALO_SEGUNDOS = 10.0
+
+# Registros cujo lote falhou voltam para o buffer; acima deste total os mais antigos
+# são descartados, para não acumular memória se o Firestore ficar indisponível
+LOGS_LIMITE_PENDENTES = 5000
+
+# Downloads de fotos e PDFs dos relatórios: quantidade em paralelo e
+# tempos limite (em segundos) de conexão e de leitura de cada arquivo
+DOWNLOADS_SIMULTANEOS = 6
+DOWNLOAD_TIMEOUT_CONEXAO_SEGUNDOS = 5
+DOWNLOAD_TIMEOUT_LEITURA_SEGUNDOS = 30
+DOWNLOAD_TAMANHO_BLOCO_BYTES = 256 * 1024
+
+# Cache em disco dos arquivos baixados do Storage (fotos e PDFs de exames),
+# com os menos usados recentemente removidos ao passar do limite de tamanho
+CACHE_ARQUIVOS_DIRETORIO = os.path.join(tempfile.gettempdir(), "pelunos_cache_arquivos")
+CACHE_ARQUIVOS_LIMITE_BYTES = 512 * 1024 * 1024
+
+# Acima deste tamanho, os PDFs intermediários e o relatório final
+# saem da memória e passam para arquivos temporários em disco
+RELATORIO_LIMITE_MEMORIA_BYTES = 8 * 1024 * 1024
+
+# Versão do layout dos relatórios; incrementar invalida os relatórios já guardados no cache
+RELATORIO_VERSAO = 3
+
+# Processos do pool compartilhado pela geração de relatórios e pela extração de texto
+# dos PDFs grandes (criados sob demanda, até este limite)
+PROCESSOS_TRABALHO = min(4, os.cpu_count() or 1)
+
+# Relatórios gerados em segundo plano: pasta das tarefas e por quanto tempo
+# (em segundos) os relatórios prontos ficam disponíveis para download
+RELATORIOS_DIRETORIO = os.path.join(tempfile.gettempdir(), "pelunos_relatorios")
+RELATORIOS_RETENCAO_SEGUNDOS = 24 * 60 * 60
+
+# Tarefa sem atualizar o status há mais que isso (em segundos) é dada como perdida
+# (ex: processo de trabalho morto ou servidor reiniciado)
+RELATORIOS_TEMPO_LIMITE_SEGUNDOS = 15 * 60
+
+# Extração de texto dos PDFs de exames: a partir deste número de páginas o PDF
+# é dividido em faixas de páginas lidas em paralelo pelo pool de processos
+PAGINAS_EXTRACAO_PARALELA = 30
+
+# Exames sem data de upload vão para o fim da ordenação (datas do Firestore têm fuso horário)
+DATA_MINIMA_UTC = datetime.min.replace(tzinfo=timezone.utc)
+
+# A análise de exames em segundo plano só existe na memória do processo: exame parado numa
+# etapa intermediária há mais que isso (em segundos) é dado como interrompido (ex: reinício do servidor)
+ANALISE_EXAME_TEMPO_LIMITE_SEGUNDOS = 15 * 60
+
+# Versões geradas no upload da foto do pet (lado máximo em pixels):
+# cards do painel, foto dos relatórios e versão completa
+RENDICOES_FOTO_PET = {"completa": 800, "card": 480, "relatorio": 300}
+
+# Tamanho máximo em bytes de cada versão da foto do pet
+ORCAMENTO_BYTES_FOTO_PET = {"completa": 120 * 1024, "card": 50 * 1024, "relatorio": 25 * 1024}
+
+# Fotos de acontecimentos: lado máximo em pixels e tamanho máximo em bytes
+LADO_MAXIMO_FOTO_ACONTECIMENTO = 1200
+ORCAMENTO_BYTES_FOTO_ACONTECIMENTO = 150 * 1024
+
+# Formatos com perda em ordem de preferência; usa o primeiro suportado pelo Pillow.
+# "avif" pode ser colocado na frente para arquivos ainda menores (codificação mais lenta)
+FORMATOS_IMAGEM_PREFERIDOS = ("webp", "jpeg")
+
+# Faixa de qualidade pesquisada para caber no orçamento de bytes
+QUALIDADE_IMAGEM_MINIMA = 40
+QUALIDADE_IMAGEM_MAXIMA = 90
+
+# Pasta com os templates do relatório HTML
+DIRETORIO_TEMPLATES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+
+
+@st.cache_resource(show_spinner=False)
+def _recursos_firebase():
+    """
+    Inicializa o Firebase uma única vez por processo e cria os clientes compartilhados.
+    As execuções seguintes do script reutilizam o resultado guardado pelo Streamlit.
+    
+    Returns:
+        dict: Dicionário com o app do Firebase ('app'), o cliente do Firestore ('db')
+              e o bucket do Storage ('bucket')
+    """
     # Usa APENAS as informações do secrets.toml - sem dependência de arquivo JSON
     if 'firebase' not in st.secrets:
         raise ValueError("Configuração do Firebase não encontrada no secrets.toml")
-        
-    print("Inicializando Firebase com secrets do Streamlit...")
     
     project_id = st.secrets.firebase.project_id
     # GARANTINDO que usa o bucket correto: .firebasestorage.app
     storage_bucket = f'{project_id}.firebasestorage.app'
     
-    # Força reinicialização completa se necessário
+    # Reaproveita o app já existente se ele usar o bucket correto
     try:
         app = firebase_admin.get_app()
-        print(f"Firebase já inicializado. Verificando bucket configurado...")
-        current_bucket = app.options.storageBucket if hasattr(app.options, 'storageBucket') else 'N/A'
-        print(f"Bucket atual configurado: {current_bucket}")
+        current_bucket = app.options.get('storageBucket')
         
         # Se o bucket for diferente, deleta e reinicializa
         if current_bucket != storage_bucket:
-            print("❌ Bucket incorreto detectado! Reinicializando Firebase...")
+            print(f"❌ Bucket incorreto detectado ({current_bucket})! Reinicializando Firebase...")
             firebase_admin.delete_app(app)
             raise ValueError("Forçando reinicialização")
-        else:
-            print(f"✅ Bucket correto já configurado: {storage_bucket}")
             
     except ValueError:
         print(f"Inicializando Firebase com project_id: {project_id}")
-        print(f"✅ Storage bucket correto: {storage_bucket}")
         
         # Cria as credenciais usando apenas o secrets.toml
         cred = credentials.Certificate({
@@ -65,22 +175,141 @@ def inicializar_firebase():
             "universe_domain": st.secrets.firebase.universe_domain
         })
         
-        firebase_admin.initialize_app(cred, {
+        app = firebase_admin.initialize_app(cred, {
             'storageBucket': storage_bucket
         })
-        print("🔥 Firebase inicializado com sucesso com bucket correto!")
+        print(f"🔥 Firebase inicializado com sucesso com o bucket {storage_bucket}!")
+    
+    return {
+        "app": app,
+        "db": firestore.client(app),
+        "bucket": storage.bucket(app=app)
+    }
+
+def inicializar_firebase():
+    """
+    Garante que o Firebase está inicializado. Só faz trabalho na primeira execução
+    do processo; nas demais apenas consulta o cache de recursos do Streamlit.
+    """
+    _recursos_firebase()
+
+def obter_db():
+    """
+    Retorna o cliente do Firestore compartilhado pelo processo.
+    
+    Returns:
+        google.cloud.firestore.Client: Cliente do Firestore
+    """
+    return _recursos_firebase()["db"]
+
+def obter_bucket():
+    """
+    Retorna o bucket do Firebase Storage compartilhado pelo processo.
+    
+    Returns:
+        google.cloud.storage.Bucket: Bucket do Storage
+    """
+    return _recursos_firebase()["bucket"]
+
+# ============================================================================
+# CACHE DE LEITURAS DA SESSÃO
+# ============================================================================
+
+def _cache_sessao():
+    """
+    Retorna o dicionário de cache de leituras do usuário logado na sessão atual.
+    O cache é descartado se outro usuário fizer login na mesma sessão.
+    
+    Returns:
+        dict: Dicionário {chave: (valor, instante_de_expiracao)}
+    """
+    cache = st.session_state.get("_cache_firestore")
+    if cache is None or cache["email"] != st.user.email:
+        cache = {"email": st.user.email, "itens": {}}
+        st.session_state["_cache_firestore"] = cache
+    return cache["itens"]
+
+def _cache_ler(chave):
+    """
+    Lê um valor do cache da sessão.
+    
+    Args:
+        chave: Tupla que identifica a leitura (ex: ("exames", pet_id))
+        
+    Returns:
+        Cópia rasa do valor guardado ou None se ausente/expirado
+    """
+    itens = _cache_sessao()
+    entrada = itens.get(chave)
+    if entrada is None:
+        return None
+    
+    valor, expira_em = entrada
+    if time.monotonic() >= expira_em:
+        del itens[chave]
+        return None
+    return copy.copy(valor)
+
+def _cache_gravar(chave, valor, ttl=CACHE_TTL_SEGUNDOS):
+    """
+    Guarda um valor no cache da sessão.
+    
+    Args:
+        chave: Tupla que identifica a leitura
+        valor: Lista ou dicionário a ser guardado
+        ttl: Tempo de vida em segundos
+    """
+    _cache_sessao()[chave] = (copy.copy(valor), time.monotonic() + ttl)
+
+def invalidar_cache(*chaves):
+    """
+    Remove leituras do cache da sessão. Sem argumentos, limpa o cache inteiro.
+    
+    Args:
+        chaves: Tuplas das leituras a remover (ex: ("usuario",), ("pets",), ("exames", pet_id))
+    """
+    if not hasattr(st.user, 'email'):
+        return
+    
+    itens = _cache_sessao()
+    if not chaves:
+        itens.clear()
+        return
+    
+    for chave in chaves:
+        itens.pop(chave, None)
 
 def login_usuario():
     """
     Registra ou atualiza dados do usuário no Firestore.
     Cria um novo registro se o usuário não existir, ou atualiza o último acesso se já existir.
+    
+    O registro só é feito uma vez por sessão; depois disso, 'ultimo_acesso' é gravado
+    no máximo uma vez a cada INTERVALO_ULTIMO_ACESSO_SEGUNDOS, sem nova leitura.
+    Como app.py a chama no início de cada execução do script, é aqui que o documento do
+    usuário da execução anterior é descartado (ver _obter_documento_usuario).
     Retorna True se for o primeiro login, False caso contrário.
     """
     if not hasattr(st.user, 'email'):
         return False # Se não houver email, não tenta registrar o usuário
         
-    db = firestore.client()
+    db = obter_db()
     doc_ref = db.collection(COLECAO_USUARIOS).document(st.user.email)
+    agora = time.monotonic()
+    
+    # Usuário já registrado nesta sessão: apenas renova o último acesso, se o intervalo expirou
+    registro = st.session_state.get("_registro_acesso")
+    if registro is not None and registro["email"] == st.user.email:
+        # Nova execução: o documento pode ter mudado em outra aba ou em segundo plano
+        invalidar_cache(("usuario",))
+        if agora - registro["instante"] >= INTERVALO_ULTIMO_ACESSO_SEGUNDOS:
+            try:
+                doc_ref.update({"ultimo_acesso": datetime.now()})
+                registro["instante"] = agora
+            except Exception as e:
+                print(f"Erro ao atualizar último acesso de {st.user.email}: {e}")
+        return False
+    
     doc = doc_ref.get()
 
     if not doc.exists:
@@ -103,20 +332,107 @@ def login_usuario():
             "primeiro_acesso_concluido": False # Flag para o formulário inicial
         }
         doc_ref.set(dados_usuario)
+        st.session_state["_registro_acesso"] = {"email": st.user.email, "instante": agora}
+        _cache_gravar(("usuario",), dados_usuario)
         registrar_acao_usuario("Cadastro", "Novo usuário registrado")
         if 'login_registrado' not in st.session_state:
              st.session_state['login_registrado'] = True # Marca como registrado para evitar loop
         return True # Indica que é o primeiro login
     else:
-        doc_ref.update({"ultimo_acesso": datetime.now()})
+        dados_usuario = doc.to_dict()
+        dados_usuario["ultimo_acesso"] = datetime.now()
+        doc_ref.update({"ultimo_acesso": dados_usuario["ultimo_acesso"]})
+        st.session_state["_registro_acesso"] = {"email": st.user.email, "instante": agora}
+        # O documento lido aqui é reaproveitado por obter_perfil_usuario
+        _cache_gravar(("usuario",), dados_usuario)
         if 'login_registrado' not in st.session_state:
             registrar_acao_usuario("Login", "Usuário fez login")
             st.session_state['login_registrado'] = True
         return False # Indica que não é o primeiro login
 
+# ============================================================================
+# REGISTRO DE LOGS EM SEGUNDO PLANO
+# ============================================================================
+
+class _BufferLogs:
+    """
+    Acumula os registros de logs e atividades e os grava no Firestore em lotes,
+    a partir de uma thread em segundo plano, sem bloquear a execução do script.
+    
+    O lote é gravado quando atinge o tamanho configurado, quando o intervalo
+    máximo expira, no logout (descarregar_logs) e no encerramento do processo.
+    Se a gravação de um lote falhar, seus registros voltam para o buffer e são
+    tentados novamente na próxima descarga.
+    """
+    
+    def __init__(self, db, tamanho_lote, intervalo):
+        self._db = db
+        self._tamanho_lote = tamanho_lote
+        self._intervalo = intervalo
+        self._pendentes = []
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        
+        threading.Thread(target=self._executar, name="buffer-logs", daemon=True).start()
+        atexit.register(self.descarregar)
+    
+    def adicionar(self, doc_ref, dados):
+        """Enfileira a gravação de um documento; grava logo se o lote estiver cheio."""
+        with self._lock:
+            self._pendentes.append((doc_ref, dados))
+            lote_cheio = len(self._pendentes) >= self._tamanho_lote
+        
+        if lote_cheio:
+            self._acordar.set()
+    
+    def descarregar(self):
+        """Grava imediatamente todos os registros pendentes."""
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, []
+        
+        falhas = []
+        for inicio in range(0, len(pendentes), LIMITE_OPERACOES_LOTE):
+            registros = pendentes[inicio:inicio + LIMITE_OPERACOES_LOTE]
+            lote = self._db.batch()
+            for doc_ref, dados in registros:
+                lote.set(doc_ref, dados)
+            try:
+                lote.commit()
+            except Exception as e:
+                print(f"Erro ao gravar lote de logs, {len(registros)} registro(s) voltam para o buffer: {e}")
+                falhas.extend(registros)
+        
+        if falhas:
+            # Os registros que falharam voltam à frente dos que chegaram durante a gravação
+            with self._lock:
+                self._pendentes = falhas + self._pendentes
+                excedentes = len(self._pendentes) - LOGS_LIMITE_PENDENTES
+                if excedentes > 0:
+                    print(f"Buffer de logs cheio: {excedentes} registro(s) mais antigo(s) descartado(s)")
+                    del self._pendentes[:excedentes]
+    
+    def _executar(self):
+        while True:
+            self._acordar.wait(timeout=self._intervalo)
+            self._acordar.clear()
+            self.descarregar()
+
+@st.cache_resource(show_spinner=False)
+def _obter_buffer_logs():
+    """Retorna o buffer de logs compartilhado pelo processo."""
+    return _BufferLogs(obter_db(), LOGS_TAMANHO_LOTE, LOGS_INTERVALO_SEGUNDOS)
+
+def descarregar_logs():
+    """
+    Grava imediatamente os logs e atividades pendentes no Firestore.
+    Usada no logout, para não depender do intervalo do buffer.
+    """
+    _obter_buffer_logs().descarregar()
+
 def registrar_acao_usuario(acao: str, detalhes: str = ""):
     """
     Registra uma ação do usuário no Firestore.
+    A gravação é feita em segundo plano, junto com outros registros pendentes.
     
     Args:
         acao: Nome da ação realizada
@@ -125,7 +441,7 @@ def registrar_acao_usuario(acao: str, detalhes: str = ""):
     if not hasattr(st.user, 'email'):
         return  # Se não houver email, não registra a ação
         
-    db = firestore.client()
+    db = obter_db()
     logs_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("logs")
     
     dados_log = {
@@ -134,11 +450,12 @@ def registrar_acao_usuario(acao: str, detalhes: str = ""):
         "data_hora": datetime.now()
     }
     
-    logs_ref.add(dados_log)
+    _obter_buffer_logs().adicionar(logs_ref.document(), dados_log)
 
 def registrar_atividade_academica(tipo: str, modulo: str, detalhes: dict):
     """
     Registra uma atividade acadêmica específica do usuário.
+    A gravação é feita em segundo plano, junto com outros registros pendentes.
     
     Args:
         tipo: Tipo da atividade (ex: 'chatbot_maria_madalena')
@@ -148,7 +465,7 @@ def registrar_atividade_academica(tipo: str, modulo: str, detalhes: dict):
     if not hasattr(st.user, 'email'):
         return
         
-    db = firestore.client()
+    db = obter_db()
     atividades_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("atividades_academicas")
     
     dados_atividade = {
@@ -158,11 +475,36 @@ def registrar_atividade_academica(tipo: str, modulo: str, detalhes: dict):
         "data_hora": datetime.now()
     }
     
-    atividades_ref.add(dados_atividade)
+    _obter_buffer_logs().adicionar(atividades_ref.document(), dados_atividade)
+
+def _obter_documento_usuario():
+    """
+    Retorna o documento do usuário logado, lido no máximo uma vez por execução do script
+    e compartilhado entre app.py e a página (o próprio login_usuario já o deixa guardado
+    no primeiro acesso e o descarta no início das execuções seguintes).
+    
+    Returns:
+        dict: Dados do documento do usuário ou None se o documento não existir
+    """
+    dados = _cache_ler(("usuario",))
+    if dados is not None:
+        return dados
+    
+    doc = obter_db().collection(COLECAO_USUARIOS).document(st.user.email).get()
+    if not doc.exists:
+        return None
+    
+    dados = doc.to_dict()
+    _cache_gravar(("usuario",), dados)
+    return dados
 
 def obter_perfil_usuario():
     """
-    Obtém os dados de perfil do usuário atual do Firestore.
+    Obtém o contexto do usuário atual: dados de perfil, resumos dos pets e flags de controle.
+    
+    O documento do usuário é lido no máximo uma vez por execução do script e compartilhado
+    entre app.py e a página, sendo recarregado também depois de atualizar_perfil_usuario/
+    atualizar_resumo_pets.
     
     Returns:
         dict: Dicionário com os dados do perfil do usuário ou None se não encontrado/erro.
@@ -170,12 +512,9 @@ def obter_perfil_usuario():
     if not hasattr(st.user, 'email'):
         return None
         
-    db = firestore.client()
-    doc_ref = db.collection(COLECAO_USUARIOS).document(st.user.email)
     try:
-        doc = doc_ref.get()
-        if doc.exists:
-            dados = doc.to_dict()
+        dados = _obter_documento_usuario()
+        if dados is not None:
             return {
                 # Campos essenciais mantidos
                 "email": dados.get("email", ""),
@@ -186,8 +525,9 @@ def obter_perfil_usuario():
                 "experiencia_pets": dados.get("experiencia_pets", ""),
                 "tipos_pets": dados.get("tipos_pets", []),
                 "situacao_atual": dados.get("situacao_atual", ""),
-                # Flag de controle
+                # Flags de controle
                 "primeiro_acesso_concluido": dados.get("primeiro_acesso_concluido", False),
+                "consentimento_assistente": dados.get("consentimento_assistente", False),
                 # Campos derivados do Google (mantidos para referência, se útil)
                 "nome_google": dados.get("nome_google", ""), 
                 "primeiro_nome_google": dados.get("primeiro_nome_google", ""),
@@ -207,6 +547,7 @@ def obter_perfil_usuario():
 def atualizar_perfil_usuario(dados_perfil):
     """
     Atualiza os dados de perfil do usuário atual.
+    O contexto do usuário em cache é descartado para ser recarregado na próxima leitura.
     
     Args:
         dados_perfil: Dicionário com os dados do perfil a serem atualizados
@@ -217,19 +558,40 @@ def atualizar_perfil_usuario(dados_perfil):
     if not hasattr(st.user, 'email'):
         return False  # Retorna False se não houver email
         
-    db = firestore.client()
+    db = obter_db()
     doc_ref = db.collection(COLECAO_USUARIOS).document(st.user.email)
     
     try:
         doc_ref.update(dados_perfil)
+        invalidar_cache(("usuario",))
         return True
     except Exception as e:
         print(f"Erro ao atualizar perfil para {st.user.email}: {e}")
         return False
 
+def _gravar_mensagens_chat(lote, chat_ref, mensagens, inicio):
+    """
+    Adiciona ao lote a gravação de mensagens na subcoleção 'mensagens' do chat.
+    Cada mensagem vira um documento pequeno, identificado pela sua posição na conversa.
+    
+    Args:
+        lote: Escrita em lote (WriteBatch) do Firestore
+        chat_ref: Referência do documento do chat
+        mensagens: Lista de mensagens a gravar
+        inicio: Posição (ordem) da primeira mensagem da lista na conversa
+    """
+    for ordem, mensagem in enumerate(mensagens, start=inicio):
+        lote.set(chat_ref.collection("mensagens").document(f"{ordem:06d}"), {
+            "role": mensagem["role"],
+            "content": mensagem["content"],
+            "ordem": ordem,
+            "data_hora": datetime.now()
+        })
+
 def salvar_chat(nome_chat, mensagens):
     """
-    Salva um chat no Firestore.
+    Salva um chat no Firestore. O documento do chat guarda apenas os metadados;
+    as mensagens ficam na subcoleção 'mensagens', uma por documento.
     
     Args:
         nome_chat: Nome do chat
@@ -241,80 +603,163 @@ def salvar_chat(nome_chat, mensagens):
     if not hasattr(st.user, 'email'):
         return None
         
-    db = firestore.client()
-    chats_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("chats")
+    db = obter_db()
+    chat_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("chats").document()
     
     try:
-        dados_chat = {
+        lote = db.batch()
+        lote.set(chat_ref, {
             "nome": nome_chat,
-            "mensagens": mensagens,
+            "total_mensagens": len(mensagens),
             "data_criacao": datetime.now(),
             "data_atualizacao": datetime.now()
-        }
-        
-        doc_ref = chats_ref.add(dados_chat)
-        return doc_ref[1].id  # Retorna o ID do documento criado
+        })
+        _gravar_mensagens_chat(lote, chat_ref, mensagens, inicio=0)
+        lote.commit()
+        return chat_ref.id  # Retorna o ID do documento criado
     except Exception as e:
         print(f"Erro ao salvar chat: {e}")
         return None
 
-def obter_chats():
+def obter_chats(limite=CHATS_POR_PAGINA, cursor=None):
     """
-    Obtém a lista de chats do usuário atual.
+    Obtém uma página da lista de chats do usuário atual, do mais recente para o mais antigo.
+    Só os campos exibidos na barra lateral são baixados, nunca as mensagens.
+    O ID do documento desempata chats com a mesma data_atualizacao, para que a
+    próxima página não pule nenhum deles.
+    
+    Args:
+        limite: Quantidade máxima de chats na página
+        cursor: Cursor retornado pela página anterior (None para a primeira página)
     
     Returns:
-        list: Lista de dicionários com dados dos chats
+        tuple: (lista de dicionários com dados dos chats, cursor da próxima página ou None se não houver mais)
     """
     if not hasattr(st.user, 'email'):
-        return []
+        return [], None
         
-    db = firestore.client()
+    db = obter_db()
     chats_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("chats")
     
     try:
-        docs = chats_ref.order_by("data_atualizacao", direction=firestore.Query.DESCENDING).get()
+        consulta = (
+            chats_ref.select(["nome", "data_atualizacao"])
+            .order_by("data_atualizacao", direction=firestore.Query.DESCENDING)
+            .order_by("__name__", direction=firestore.Query.DESCENDING)  # ID do documento
+        )
+        if cursor is not None:
+            data_atualizacao, chat_id = cursor
+            consulta = consulta.start_after({"data_atualizacao": data_atualizacao, "__name__": chat_id})
+        
+        # Busca um item a mais só para saber se existe uma próxima página
+        docs = consulta.limit(limite + 1).get()
         chats = []
-        for doc in docs:
+        for doc in docs[:limite]:
             chat_data = doc.to_dict()
             chats.append({
                 "id": doc.id,
                 "nome": chat_data.get("nome", "Chat sem nome"),
-                "data_criacao": chat_data.get("data_criacao"),
                 "data_atualizacao": chat_data.get("data_atualizacao")
             })
-        return chats
+        
+        proximo_cursor = (chats[-1]["data_atualizacao"], chats[-1]["id"]) if len(docs) > limite else None
+        return chats, proximo_cursor
     except Exception as e:
         print(f"Erro ao obter chats: {e}")
-        return []
+        return [], None
+
+def _ler_mensagens_chat(chat_ref, antes_de=None, limite=MENSAGENS_POR_PAGINA):
+    """
+    Lê um bloco de mensagens da subcoleção do chat, começando pelas mais recentes.
+    
+    Args:
+        chat_ref: Referência do documento do chat
+        antes_de: Lê apenas mensagens com ordem menor que este valor (opcional)
+        limite: Quantidade máxima de mensagens (None para todas)
+        
+    Returns:
+        tuple: (mensagens em ordem cronológica, ordem da primeira mensagem retornada ou None)
+    """
+    consulta = chat_ref.collection("mensagens").order_by("ordem", direction=firestore.Query.DESCENDING)
+    if antes_de is not None:
+        consulta = consulta.start_after({"ordem": antes_de})
+    if limite is not None:
+        consulta = consulta.limit(limite)
+    
+    docs = list(reversed(consulta.get()))
+    mensagens = [{"role": doc.get("role"), "content": doc.get("content")} for doc in docs]
+    primeira_ordem = docs[0].get("ordem") if docs else None
+    return mensagens, primeira_ordem
 
 def obter_chat(chat_id):
     """
-    Obtém um chat específico pelo ID.
+    Obtém um chat específico pelo ID, com o bloco de mensagens mais recente.
+    Mensagens mais antigas podem ser carregadas sob demanda com obter_mensagens_anteriores.
     
     Args:
         chat_id: ID do chat a ser obtido
         
     Returns:
-        dict: Dados do chat ou None se não encontrado
+        dict: Dados do chat ou None se não encontrado. Inclui 'mensagens' (ordem cronológica),
+              'total_mensagens' e 'primeira_ordem' (posição da primeira mensagem carregada)
     """
     if not hasattr(st.user, 'email'):
         return None
         
-    db = firestore.client()
+    db = obter_db()
     chat_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("chats").document(chat_id)
     
     try:
         doc = chat_ref.get()
-        if doc.exists:
-            return doc.to_dict()
-        return None
+        if not doc.exists:
+            return None
+        
+        chat = doc.to_dict()
+        
+        # Conversas antigas guardavam todas as mensagens em um único array no documento
+        if "mensagens" in chat:
+            mensagens_legado = chat["mensagens"]
+            mensagens_novas, _ = _ler_mensagens_chat(chat_ref, limite=None)
+            chat["mensagens"] = mensagens_legado + mensagens_novas
+            chat.setdefault("total_mensagens", len(chat["mensagens"]))
+            chat["primeira_ordem"] = 0
+            return chat
+        
+        chat["mensagens"], primeira_ordem = _ler_mensagens_chat(chat_ref)
+        chat["primeira_ordem"] = primeira_ordem or 0
+        return chat
     except Exception as e:
         print(f"Erro ao obter chat {chat_id}: {e}")
         return None
 
+def obter_mensagens_anteriores(chat_id, antes_de, limite=MENSAGENS_POR_PAGINA):
+    """
+    Obtém o bloco de mensagens imediatamente anterior às já carregadas de um chat.
+    
+    Args:
+        chat_id: ID do chat
+        antes_de: Ordem da primeira mensagem já carregada
+        limite: Quantidade máxima de mensagens
+        
+    Returns:
+        tuple: (mensagens em ordem cronológica, ordem da primeira mensagem retornada)
+    """
+    if not hasattr(st.user, 'email'):
+        return [], antes_de
+        
+    db = obter_db()
+    chat_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("chats").document(chat_id)
+    
+    try:
+        mensagens, primeira_ordem = _ler_mensagens_chat(chat_ref, antes_de=antes_de, limite=limite)
+        return mensagens, (primeira_ordem if primeira_ordem is not None else 0)
+    except Exception as e:
+        print(f"Erro ao obter mensagens anteriores do chat {chat_id}: {e}")
+        return [], antes_de
+
 def excluir_chat(chat_id):
     """
-    Exclui um chat específico pelo ID.
+    Exclui um chat específico pelo ID, junto com sua subcoleção de mensagens.
     
     Args:
         chat_id: ID do chat a ser excluído
@@ -325,23 +770,37 @@ def excluir_chat(chat_id):
     if not hasattr(st.user, 'email'):
         return False
         
-    db = firestore.client()
+    db = obter_db()
     chat_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("chats").document(chat_id)
     
     try:
-        chat_ref.delete()
+        # O Firestore não apaga subcoleções junto com o documento
+        lote = db.batch()
+        operacoes = 0
+        for mensagem_ref in chat_ref.collection("mensagens").list_documents(page_size=LIMITE_OPERACOES_LOTE):
+            lote.delete(mensagem_ref)
+            operacoes += 1
+            if operacoes == LIMITE_OPERACOES_LOTE:
+                lote.commit()
+                lote = db.batch()
+                operacoes = 0
+        
+        lote.delete(chat_ref)
+        lote.commit()
         return True
     except Exception as e:
         print(f"Erro ao excluir chat {chat_id}: {e}")
         return False
 
-def atualizar_chat(chat_id, mensagens):
+def atualizar_chat(chat_id, novas_mensagens, inicio):
     """
-    Atualiza um chat específico com novas mensagens.
+    Acrescenta novas mensagens a um chat existente. Apenas as mensagens novas são
+    gravadas, sem reescrever o histórico já salvo.
     
     Args:
         chat_id: ID do chat a ser atualizado
-        mensagens: Lista atualizada de mensagens
+        novas_mensagens: Lista com as mensagens ainda não salvas
+        inicio: Posição (ordem) da primeira mensagem nova na conversa
         
     Returns:
         bool: True se atualização foi bem-sucedida, False caso contrário
@@ -349,14 +808,17 @@ def atualizar_chat(chat_id, mensagens):
     if not hasattr(st.user, 'email'):
         return False
         
-    db = firestore.client()
+    db = obter_db()
     chat_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("chats").document(chat_id)
     
     try:
-        chat_ref.update({
-            "mensagens": mensagens,
+        lote = db.batch()
+        _gravar_mensagens_chat(lote, chat_ref, novas_mensagens, inicio=inicio)
+        lote.update(chat_ref, {
+            "total_mensagens": inicio + len(novas_mensagens),
             "data_atualizacao": datetime.now()
         })
+        lote.commit()
         return True
     except Exception as e:
         print(f"Erro ao atualizar chat {chat_id}: {e}")
@@ -418,17 +880,108 @@ def calcular_idade(nascimento):
         # Junta os dois primeiros com ", " e o último com " e "
         return ", ".join(partes_idade[:-1]) + " e " + partes_idade[-1]
 
+def _formato_imagem_com_perda():
+    """
+    Retorna o primeiro formato de FORMATOS_IMAGEM_PREFERIDOS suportado pelo Pillow.
+    """
+    for formato in FORMATOS_IMAGEM_PREFERIDOS:
+        if formato == "jpeg" or features.check(formato):
+            return formato
+    return "jpeg"
+
+def _salvar_imagem(img, formato, **opcoes):
+    """
+    Codifica a imagem no formato indicado, sem metadados EXIF.
+    
+    Returns:
+        bytes: Imagem codificada
+    """
+    buffer = io.BytesIO()
+    img.save(buffer, format=formato.upper(), exif=b"", **opcoes)
+    return buffer.getvalue()
+
+def codificar_imagem(img, orcamento_bytes):
+    """
+    Codifica uma imagem no melhor formato para o conteúdo, dentro de um orçamento de bytes.
+    
+    Imagens com poucas cores (capturas de tela, desenhos) são testadas primeiro
+    sem perda. As demais usam o formato com perda preferido, com a maior
+    qualidade que cabe no orçamento (busca binária entre QUALIDADE_IMAGEM_MINIMA
+    e QUALIDADE_IMAGEM_MAXIMA). Nenhum metadado EXIF é mantido.
+    
+    Args:
+        img: Imagem PIL já redimensionada e com a orientação aplicada
+        orcamento_bytes: Tamanho máximo desejado em bytes
+        
+    Returns:
+        tuple: (bytes da imagem, extensão do arquivo, content type)
+    """
+    formato = _formato_imagem_com_perda()
+    tem_transparencia = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+    
+    img = img.convert("RGBA" if tem_transparencia else "RGB")
+    
+    # JPEG não tem transparência: sem outro formato, a imagem segue como PNG
+    if tem_transparencia and formato == "jpeg":
+        return _salvar_imagem(img, "png", optimize=True), "png", "image/png"
+    
+    # Poucas cores: sem perda costuma ser menor e mais nítido
+    if img.getcolors(maxcolors=256) is not None:
+        if formato == "webp":
+            conteudo, formato_sem_perda = _salvar_imagem(img, "webp", lossless=True), "webp"
+        else:
+            conteudo, formato_sem_perda = _salvar_imagem(img, "png", optimize=True), "png"
+        if len(conteudo) <= orcamento_bytes:
+            return conteudo, formato_sem_perda, f"image/{formato_sem_perda}"
+    
+    # Busca a maior qualidade que cabe no orçamento
+    minima, maxima = QUALIDADE_IMAGEM_MINIMA, QUALIDADE_IMAGEM_MAXIMA
+    melhor = None
+    while minima <= maxima:
+        qualidade = (minima + maxima) // 2
+        conteudo = _salvar_imagem(img, formato, quality=qualidade)
+        if len(conteudo) <= orcamento_bytes:
+            melhor = conteudo
+            minima = qualidade + 1
+        else:
+            maxima = qualidade - 1
+    
+    # Nem a qualidade mínima coube: usa a menor versão possível
+    if melhor is None:
+        melhor = _salvar_imagem(img, formato, quality=QUALIDADE_IMAGEM_MINIMA)
+    
+    extensao = "jpg" if formato == "jpeg" else formato
+    return melhor, extensao, f"image/{formato}"
+
+def _enviar_imagem_storage(bucket, nome_arquivo, conteudo, content_type):
+    """
+    Envia uma imagem já codificada ao Storage, torna-a pública e a deixa no cache local.
+    Pode ser executada em threads (não usa o Streamlit).
+    
+    Returns:
+        str: URL pública da imagem
+    """
+    blob = bucket.blob(nome_arquivo)
+    blob.upload_from_string(conteudo, content_type=content_type)
+    blob.make_public()
+    gravar_arquivo_cache(blob.public_url, conteudo)
+    return blob.public_url
+
 def fazer_upload_imagem_pet(imagem_file, pet_id, pet_nome):
     """
     Faz upload de uma imagem para o Firebase Storage com nova estrutura hierárquica.
     
+    Em uma única passada são geradas as versões definidas em RENDICOES_FOTO_PET
+    (cada uma reduzida a partir da anterior), enviadas lado a lado no Storage.
+    As URLs são gravadas no campo `fotos` do documento do pet.
+    
     Args:
         imagem_file: Arquivo de imagem do Streamlit
         pet_id: ID do pet para organização no storage
         pet_nome: Nome do pet para criar nome único do arquivo
         
     Returns:
-        str: URL pública da imagem ou None se falhou
+        str: URL pública da versão completa da imagem ou None se falhou
     """
     if not hasattr(st.user, 'email'):
         print("Erro: usuário não autenticado para upload de imagem")
@@ -441,32 +994,33 @@ def fazer_upload_imagem_pet(imagem_file, pet_id, pet_nome):
             print("Erro: arquivo de imagem é None")
             return None
             
-        # Cria um nome único para a imagem com nova estrutura hierárquica
-        extensao = imagem_file.name.split('.')[-1].lower()
-        nome_arquivo = f"usuarios/{st.user.email}/pets/{pet_id}/fotos/{pet_nome}_{uuid.uuid4().hex}.{extensao}"
-        
-        # Redimensiona a imagem para otimizar armazenamento
-        img = Image.open(imagem_file)
-        img.thumbnail((800, 800), Image.Resampling.LANCZOS)
-        
-        # Converte para bytes
-        img_bytes = io.BytesIO()
-        if extensao.lower() in ['jpg', 'jpeg']:
-            img.save(img_bytes, format='JPEG', quality=85)
-        else:
-            img.save(img_bytes, format='PNG')
-        img_bytes.seek(0)
+        # Cria um prefixo único para as versões da imagem com nova estrutura hierárquica
+        prefixo = f"usuarios/{st.user.email}/pets/{pet_id}/fotos/{pet_nome}_{uuid.uuid4().hex}"
         
-        # Upload para Firebase Storage
-        bucket = storage.bucket()
-        blob = bucket.blob(nome_arquivo)
-        blob.upload_from_file(img_bytes, content_type=f'image/{extensao}')
+        # Aplica a orientação da câmera (o EXIF não é mantido nas versões)
+        img = ImageOps.exif_transpose(Image.open(imagem_file))
         
-        # Torna a imagem pública
-        blob.make_public()
-        url_publica = blob.public_url
+        # Redimensiona e codifica cada versão, da maior para a menor
+        versoes = {}
+        for rendicao, tamanho in sorted(RENDICOES_FOTO_PET.items(), key=lambda item: -item[1]):
+            img.thumbnail((tamanho, tamanho), Image.Resampling.LANCZOS)
+            versoes[rendicao] = codificar_imagem(img, ORCAMENTO_BYTES_FOTO_PET[rendicao])
         
-        return url_publica
+        # Upload das versões em paralelo para o Firebase Storage
+        bucket = obter_bucket()
+        with ThreadPoolExecutor(max_workers=len(versoes)) as executor:
+            futuros = {
+                rendicao: executor.submit(_enviar_imagem_storage, bucket, f"{prefixo}_{rendicao}.{extensao}", conteudo, content_type)
+                for rendicao, (conteudo, extensao, content_type) in versoes.items()
+            }
+            fotos = {rendicao: futuro.result() for rendicao, futuro in futuros.items()}
+        
+        # Guarda as URLs de todas as versões no documento do pet
+        pet_ref = obter_db().collection(COLECAO_USUARIOS).document(st.user.email).collection("pets").document(pet_id)
+        pet_ref.update({"fotos": fotos})
+        invalidar_cache(("pets",))
+        
+        return fotos["completa"]
         
     except Exception as e:
         import traceback
@@ -474,6 +1028,20 @@ def fazer_upload_imagem_pet(imagem_file, pet_id, pet_nome):
         print(f"Traceback completo: {traceback.format_exc()}")
         return None
 
+def url_foto_pet(pet, rendicao="completa"):
+    """
+    Retorna a URL da versão pedida da foto do pet ("card", "relatorio" ou "completa").
+    Pets cadastrados antes das versões usam a foto original.
+    
+    Args:
+        pet: Dicionário do pet
+        rendicao: Nome da versão da foto
+        
+    Returns:
+        str: URL da foto ou "" se o pet não tem foto
+    """
+    return (pet.get("fotos") or {}).get(rendicao) or pet.get("url_foto") or ""
+
 def salvar_pet(nome, especie, idade, raca, sexo, castrado, peso, altura, historia, saude, alimentacao, url_foto):
     """
     Salva um pet no Firestore com todas as informações detalhadas.
@@ -498,7 +1066,7 @@ def salvar_pet(nome, especie, idade, raca, sexo, castrado, peso, altura, histori
     if not hasattr(st.user, 'email'):
         return None
         
-    db = firestore.client()
+    db = obter_db()
     pets_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("pets")
     
     try:
@@ -526,6 +1094,7 @@ def salvar_pet(nome, especie, idade, raca, sexo, castrado, peso, altura, histori
         
         # Salvando pet no Firestore
         doc_ref = pets_ref.add(dados_pet)
+        invalidar_cache(("pets",))
         return doc_ref[1].id  # Retorna o ID do documento criado
     except Exception as e:
         print(f"Erro ao salvar pet: {e}")
@@ -540,8 +1109,12 @@ def obter_pets():
     """
     if not hasattr(st.user, 'email'):
         return []
+    
+    pets_em_cache = _cache_ler(("pets",))
+    if pets_em_cache is not None:
+        return pets_em_cache
         
-    db = firestore.client()
+    db = obter_db()
     pets_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("pets")
     
     try:
@@ -559,6 +1132,7 @@ def obter_pets():
                 "sexo": pet_data.get("sexo", "Não informado"),
                 "castrado": pet_data.get("castrado", "Não sei"),
                 "url_foto": pet_data.get("url_foto", ""),
+                "fotos": pet_data.get("fotos", {}),
                 
                 # Informações detalhadas
                 "peso": pet_data.get("peso", 0),
@@ -571,6 +1145,7 @@ def obter_pets():
                 "data_cadastro": pet_data.get("data_cadastro"),
                 "data_atualizacao": pet_data.get("data_atualizacao")
             })
+        _cache_gravar(("pets",), pets)
         return pets
     except Exception as e:
         print(f"Erro ao obter pets: {e}")
@@ -601,7 +1176,7 @@ def editar_pet(pet_id, nome, especie, idade, raca, sexo, castrado, peso, altura,
     if not hasattr(st.user, 'email'):
         return False
         
-    db = firestore.client()
+    db = obter_db()
     pet_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("pets").document(pet_id)
     
     try:
@@ -628,6 +1203,7 @@ def editar_pet(pet_id, nome, especie, idade, raca, sexo, castrado, peso, altura,
         
         # Atualizando pet no Firestore
         pet_ref.update(dados_pet)
+        invalidar_cache(("pets",))
         return True
     except Exception as e:
         print(f"Erro ao editar pet {pet_id}: {e}")
@@ -663,11 +1239,21 @@ def atualizar_resumo_pets(pets):
         texto_final = "---".join(resumos)
 
     # Conectando à base de dados e guardando a informação
-    db = firestore.client()
+    db = obter_db()
     pets_ref = db.collection(COLECAO_USUARIOS).document(st.user.email)
 
+    dados = {"resumos_pet": texto_final}
+
+    # Mantém nome e ordem dos pets no resumo de exames, se ele já foi montado
+    dados_usuario = _obter_documento_usuario() or {}
+    if "resumos_exames" in dados_usuario:
+        for ordem, info in enumerate(pets or []):
+            dados[f"resumos_exames.{info['id']}.nome"] = info.get("nome", "")
+            dados[f"resumos_exames.{info['id']}.ordem"] = ordem
+
     try:
-      pets_ref.update({"resumos_pet": texto_final})
+      pets_ref.update(dados)
+      invalidar_cache(("usuario",))
 
     except Exception as e:
         print(f"Erro ao salvar o resumo no perfil: {e}")
@@ -686,672 +1272,578 @@ def excluir_pet(pet_id):
     if not hasattr(st.user, 'email'):
         return False
         
-    db = firestore.client()
+    db = obter_db()
     pet_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("pets").document(pet_id)
     
     try:
         pet_ref.delete()
-        return True
     except Exception as e:
         print(f"Erro ao excluir pet {pet_id}: {e}")
         return False
+    
+    # O pet já foi excluído: uma falha ao limpar o resumo dos exames não desfaz a exclusão
+    try:
+        db.collection(COLECAO_USUARIOS).document(st.user.email).update({f"resumos_exames.{pet_id}": firestore.DELETE_FIELD})
+    except Exception as e:
+        print(f"Erro ao remover o resumo dos exames do pet {pet_id}: {e}")
+    
+    invalidar_cache(("usuario",), ("pets",), ("exames", pet_id), ("acontecimentos", pet_id))
+    return True
 
 # ============================================================================
 # FUNÇÃO ALTERNATIVA PARA GERAR RELATÓRIO HTML DO PET
 # ============================================================================
 
-def gerar_relatorio_pet_html(pet_data, motivo_consulta=""):
+def _compilar_template(texto):
+    """
+    Compila um template com marcadores $nome: o texto é dividido uma única vez em
+    trechos fixos e nomes de campos, e cada renderização apenas intercala os valores.
+    
+    Returns:
+        function: Função que recebe os valores como argumentos nomeados e retorna o texto final
+    """
+    partes = re.split(r"\$(\w+)", texto)
+    trechos = partes[0::2]
+    campos = partes[1::2]
+    
+    def renderizar(**valores):
+        saida = [trechos[0]]
+        for campo, trecho in zip(campos, trechos[1:]):
+            saida.append(str(valores[campo]))
+            saida.append(trecho)
+        return "".join(saida)
+    
+    return renderizar
+
+@functools.cache
+def _templates_relatorio_html():
+    """
+    Lê e compila uma única vez por processo os templates do relatório HTML
+    (pasta paginas/templates), incluindo o CSS estático. Usa functools.cache em vez de
+    st.cache_resource porque a consulta é feita a cada relatório e precisa ser barata.
+    
+    Returns:
+        dict: Templates compilados (funções de renderização) por nome e o CSS já lido em 'estilos'
+    """
+    templates = {}
+    for nome in ("relatorio_pet", "relatorio_pet_secao", "relatorio_pet_exames", "relatorio_pet_exame", "relatorio_pet_acontecimento"):
+        with open(os.path.join(DIRETORIO_TEMPLATES, f"{nome}.html"), encoding="utf-8") as arquivo:
+            templates[nome] = _compilar_template(arquivo.read())
+    
+    with open(os.path.join(DIRETORIO_TEMPLATES, "relatorio_pet.css"), encoding="utf-8") as arquivo:
+        templates["estilos"] = arquivo.read()
+    
+    return templates
+
+def _tipo_exame_relatorio(nome_exame):
+    """
+    Classifica o exame pelo nome, para a coluna 'Tipo' do relatório HTML.
+    """
+    nome_lower = nome_exame.lower()
+    for tipo, palavras in (
+        ("Sangue", ['sangue', 'hemograma', 'bioquimic']),
+        ("Raio-X", ['raio', 'radiograf', 'rx']),
+        ("Ultrassom", ['ultra', 'ecograf']),
+        ("Urina", ['urina', 'urinalis']),
+        ("Fezes", ['fezes', 'parasit']),
+        ("Cardiológico", ['cardiologico', 'coração', 'eco']),
+        ("Oftalmológico", ['oftalmologic', 'olho', 'visão']),
+    ):
+        if any(palavra in nome_lower for palavra in palavras):
+            return tipo
+    return "Geral"
+
+def _data_upload_relatorio(data_upload):
+    """
+    Formata a data de upload do exame (dd/mm/aaaa) para o relatório HTML.
+    """
+    if not data_upload:
+        return 'N/A'
+    if hasattr(data_upload, "date"):
+        return f"{data_upload.day:02d}/{data_upload.month:02d}/{data_upload.year}"
+    return str(data_upload)[:10]
+
+def _data_hora_relatorio(data_hora):
+    """
+    Formata a data e hora do acontecimento para o relatório HTML.
+    """
+    if not data_hora:
+        return 'Data não disponível'
+    if hasattr(data_hora, "strftime"):
+        # Formatação direta: strftime domina o tempo do relatório com muitos acontecimentos
+        return f"{data_hora.day:02d}/{data_hora.month:02d}/{data_hora.year} as {data_hora.hour:02d}:{data_hora.minute:02d}"
+    return str(data_hora)[:19].replace("T", " as ")
+
+def _data_dados_relatorio(pet_data, exames, acontecimentos):
+    """
+    Data da alteração mais recente nos dados do relatório (pet, exames e acontecimentos).
+    Essas datas fazem parte da impressão digital do relatório, então a data
+    continua correta quando o relatório é entregue a partir do cache.
+    """
+    datas = [item.get("data_atualizacao") for item in [pet_data, *exames, *acontecimentos]]
+    datas = [data for data in datas if hasattr(data, "strftime")]
+    if not datas:
+        return "Não disponível"
+    return _data_hora_relatorio(max(datas, key=lambda data: data if data.tzinfo else data.replace(tzinfo=timezone.utc)))
+
+def gerar_relatorio_pet_html(pet_data, motivo_consulta="", exames=None, acontecimentos=None):
     """
     Gera um relatório HTML minimalista e profissional do pet para veterinário.
     
+    O layout fica nos templates de paginas/templates, compilados uma única vez;
+    aqui apenas os dados são formatados e substituídos.
+    
     Args:
         pet_data: Dicionário com dados do pet
         motivo_consulta: Motivo da consulta (opcional)
+        exames: Lista de exames já carregada (opcional, consulta o Firestore se None)
+        acontecimentos: Lista de acontecimentos já carregada (opcional, consulta o Firestore se None)
         
     Returns:
         str: Conteúdo HTML do relatório
     """
-    from datetime import datetime
-    
-    # Data atual formatada
-    data_atual = datetime.now().strftime("%d/%m/%Y as %H:%M")
-    
-    # Obtém exames e acontecimentos
-    exames = obter_exames_pet(pet_data.get('id'))
-    acontecimentos = obter_acontecimentos_pet(pet_data.get('id'))
-    
-    # HTML do relatório - Design minimalista e profissional
-    html = f"""
-    <!DOCTYPE html>
-    <html lang="pt-BR">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Relatório Veterinário - {pet_data.get('nome', 'Pet')} - Pelunos</title>
-        <style>
-            * {{
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }}
-            
-            body {{
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                line-height: 1.6;
-                color: #333;
-                background: #ffffff;
-                font-size: 14px;
-            }}
-            
-            .container {{
-                max-width: 900px;
-                margin: 0 auto;
-                padding: 20px;
-                background: white;
-            }}
-            
-            .header {{
-                text-align: center;
-                border-bottom: 3px solid #004aad;
-                padding-bottom: 20px;
-                margin-bottom: 30px;
-            }}
-            
-            .header-logo {{
-                width: 80px;
-                height: 80px;
-                margin-bottom: 15px;
-            }}
-            
-            .app-name {{
-                font-size: 32px;
-                font-weight: bold;
-                color: #004aad;
-                margin-bottom: 10px;
-                text-shadow: 0 2px 4px rgba(0,0,0,0.1);
-            }}
-            
-            .subtitle {{
-                font-size: 14px;
-                color: #666;
-                margin-bottom: 15px;
-            }}
-            
-            .title {{
-                font-size: 20px;
-                font-weight: bold;
-                color: #333;
-                margin-bottom: 20px;
-            }}
-            
-            .pet-info {{
-                display: flex;
-                align-items: flex-start;
-                justify-content: center;
-                gap: 30px;
-                margin: 20px 0;
-                padding: 20px;
-                background: #f8f9fa;
-                border-radius: 8px;
-                border: 1px solid #e0e0e0;
-            }}
-            
-            .pet-photo {{
-                width: 140px;
-                height: 140px;
-                border-radius: 50%;
-                border: 4px solid #004aad;
-                object-fit: cover;
-                box-shadow: 0 4px 12px rgba(0,0,0,0.15);
-                flex-shrink: 0;
-            }}
-            
-            .pet-photo-placeholder {{
-                width: 140px;
-                height: 140px;
-                border-radius: 50%;
-                border: 4px solid #004aad;
-                background: #f0f0f0;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                font-size: 36px;
-                color: #666;
-                flex-shrink: 0;
-            }}
-            
-            .pet-basic {{
-                text-align: left;
-                flex: 1;
-            }}
-            
-            .pet-name {{
-                font-size: 24px;
-                font-weight: bold;
-                color: #333;
-                margin-bottom: 15px;
-            }}
-            
-            .pet-details {{
-                color: #666;
-                font-size: 16px;
-                line-height: 2.2;
-            }}
-            
-            .pet-details .info-line {{
-                margin-bottom: 8px;
-            }}
-            
-            .pet-details strong {{
-                color: #004aad;
-                font-weight: 600;
-            }}
-            
-            .section {{
-                margin-bottom: 25px;
-                border: 1px solid #e0e0e0;
-                border-radius: 5px;
-                overflow: hidden;
-            }}
-            
-            .section-header {{
-                background: #f8f9fa;
-                padding: 12px 15px;
-                border-bottom: 1px solid #e0e0e0;
-                font-weight: bold;
-                color: #333;
-                font-size: 15px;
-            }}
-            
-            .section-content {{
-                padding: 15px;
-            }}
-            
-            .text-content {{
-                color: #333;
-                line-height: 1.6;
-                text-align: justify;
-            }}
-            
-            .no-data-message {{
-                text-align: center;
-                color: #666;
-                font-style: italic;
-                padding: 20px;
-                background: #fafafa;
-                border-radius: 5px;
-                border: 1px dashed #ddd;
-            }}
-            
-            .exames-table {{
-                width: 100%;
-                border-collapse: collapse;
-                margin-top: 10px;
-                font-size: 12px;
-            }}
-            
-            .exames-table th {{
-                background: #f8f9fa;
-                color: #333;
-                padding: 10px;
-                text-align: left;
-                font-weight: bold;
-                border-bottom: 2px solid #e0e0e0;
-            }}
-            
-            .exames-table td {{
-                padding: 8px 10px;
-                border-bottom: 1px solid #e0e0e0;
-            }}
-            
-            .exames-table tr:nth-child(even) {{
-                background: #fafafa;
-            }}
-            
-            .exames-table tr:hover {{
-                background: #f0f0f0;
-            }}
-            
-            .exame-link {{
-                color: #004aad;
-                text-decoration: none;
-                font-weight: 600;
-                padding: 4px 8px;
-                background: #e3f2fd;
-                border-radius: 4px;
-                font-size: 11px;
-            }}
-            
-            .exame-link:hover {{
-                background: #bbdefb;
-                text-decoration: underline;
-            }}
-            
-            .acontecimento-item {{
-                border-bottom: 1px solid #e0e0e0;
-                padding: 12px 0;
-            }}
-            
-            .acontecimento-item:last-child {{
-                border-bottom: none;
-            }}
-            
-            .acontecimento-layout {{
-                display: flex;
-                gap: 15px;
-                align-items: flex-start;
-            }}
-            
-            .acontecimento-photo-col {{
-                flex: 0 0 80px;
-                text-align: center;
-            }}
-            
-            .acontecimento-info-col {{
-                flex: 1;
-            }}
-            
-            .acontecimento-header {{
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                margin-bottom: 8px;
-            }}
-            
-            .acontecimento-date {{
-                background: #004aad;
-                color: white;
-                padding: 4px 10px;
-                border-radius: 15px;
-                font-size: 11px;
-                font-weight: bold;
-            }}
-            
-            .acontecimento-number {{
-                background: #fd5e21;
-                color: white;
-                width: 24px;
-                height: 24px;
-                border-radius: 50%;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                font-weight: bold;
-                font-size: 11px;
-            }}
-            
-            .acontecimento-photo {{
-                width: 80px;
-                height: 80px;
-                border-radius: 5px;
-                object-fit: cover;
-                box-shadow: 0 2px 5px rgba(0,0,0,0.1);
-            }}
-            
-            .acontecimento-photo-placeholder {{
-                width: 80px;
-                height: 80px;
-                border-radius: 5px;
-                background: #f0f0f0;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                font-size: 24px;
-                color: #666;
-                border: 1px dashed #ddd;
-            }}
-            
-            .footer-bottom {{
-                display: flex;
-                align-items: flex-start;
-                justify-content: space-between;
-                gap: 30px;
-                margin-top: 30px;
-                padding: 20px;
-                background: #f5f5f5;
-                border-radius: 8px;
-                border: 1px solid #e0e0e0;
-            }}
-            
-            .footer-left {{
-                flex: 1;
-                text-align: left;
-            }}
-            
-            .footer-right {{
-                flex: 1;
-                text-align: left;
-            }}
-            
-            .footer-logo-img {{
-                width: 16px;
-                height: 16px;
-                margin-right: 6px;
-                vertical-align: middle;
-                opacity: 0.7;
-            }}
-            
-            .footer-logo-text {{
-                font-weight: 600;
-                color: #666;
-                font-size: 11px;
-            }}
-            
-            .footer {{
-                text-align: center;
-                border-top: 2px solid #e0e0e0;
-                padding-top: 20px;
-                margin-top: 30px;
-                color: #666;
-                font-size: 12px;
-            }}
-            
-            .footer-info {{
-                margin-bottom: 15px;
-                line-height: 1.6;
-            }}
-            
-            .footer-brand {{
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                margin-top: 15px;
-                opacity: 0.6;
-            }}
-            
-            .data-label {{
-                font-weight: bold;
-                color: #004aad;
-                margin-bottom: 8px;
-                font-size: 12px;
-                text-transform: uppercase;
-            }}
-            
-            .data-value {{
-                color: #333;
-                font-size: 14px;
-                font-weight: 600;
-            }}
-            
-            .observacoes-title {{
-                font-weight: bold;
-                color: #004aad;
-                margin-bottom: 8px;
-                font-size: 12px;
-                text-transform: uppercase;
-            }}
-            
-            .observacoes-text {{
-                color: #666;
-                font-size: 12px;
-                line-height: 1.5;
-            }}
-            
-            @media print {{
-                body {{
-                    background: white;
-                }}
-                .container {{
-                    padding: 0;
-                    max-width: none;
-                }}
-                .header {{
-                    border-bottom-color: #000;
-                }}
-                .section {{
-                    border-color: #000;
-                    break-inside: avoid;
-                }}
-                .section-header {{
-                    background: #f0f0f0;
-                }}
-                .pet-info {{
-                    background: #f0f0f0;
-                    border-color: #000;
-                }}
-                .footer-bottom {{
-                    background: #f0f0f0;
-                    border-color: #000;
-                }}
-            }}
-            
-            @media (max-width: 768px) {{
-                .container {{
-                    padding: 15px;
-                }}
-                .pet-info {{
-                    flex-direction: column;
-                    text-align: center;
-                    gap: 20px;
-                }}
-                .pet-photo,
-                .pet-photo-placeholder {{
-                    width: 120px;
-                    height: 120px;
-                }}
-                .footer-bottom {{
-                    flex-direction: column;
-                    gap: 20px;
-                }}
-                .exames-table {{
-                    font-size: 11px;
-                }}
-                .exames-table th,
-                .exames-table td {{
-                    padding: 6px 8px;
-                }}
-                .acontecimento-layout {{
-                    flex-direction: column;
-                    gap: 10px;
-                }}
-                .acontecimento-photo-col {{
-                    flex: none;
-                    text-align: center;
-                }}
-                .acontecimento-photo,
-                .acontecimento-photo-placeholder {{
-                    width: 60px;
-                    height: 60px;
-                }}
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <!-- Cabeçalho -->
-            <div class="header">
-                <img src="arquivos/avatar_assistente.png" alt="Pelunos" class="header-logo">
-                <div class="app-name">Pelunos</div>
-                <div class="subtitle">Assistente Veterinário Digital</div>
-                <div class="title">Relatório Veterinário</div>
-            </div>
-            
-            <!-- Informações Básicas com Foto -->
-            <div class="section">
-                <div class="section-header">📋 Informações Básicas</div>
-                <div class="section-content">
-                    <div class="pet-info">
-                        {f'<img src="{pet_data.get("url_foto", "https://via.placeholder.com/140x140?text=🐾")}" alt="{pet_data.get("nome", "Pet")}" class="pet-photo">' if pet_data.get('url_foto') else '<div class="pet-photo-placeholder">🐾</div>'}
-                        
-                        <div class="pet-basic">
-                            <div class="pet-name">{pet_data.get('nome', 'Não informado')}</div>
-                            <div class="pet-details">
-                                <div class="info-line">
-                                    <strong>Espécie:</strong> {pet_data.get('especie', 'Não informada')} • 
-                                    <strong>Raça:</strong> {pet_data.get('raca', 'Não informada')} • 
-                                    <strong>Sexo:</strong> {pet_data.get('sexo', 'Não informado')}
-                                </div>
-                                <div class="info-line">
-                                    <strong>Idade:</strong> {pet_data.get('idade', 'Não informado')} anos • 
-                                    <strong>Peso:</strong> {pet_data.get('peso', 'Não informado')} kg • 
-                                    <strong>Castrado:</strong> {pet_data.get('castrado', 'Não informado')}
-                                </div>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-            
-            <!-- Motivo da Consulta -->
-            {f'''
-            <div class="section">
-                <div class="section-header">🏥 Motivo da Consulta</div>
-                <div class="section-content">
-                    <div class="text-content">{motivo_consulta}</div>
-                </div>
-            </div>
-            ''' if motivo_consulta and len(motivo_consulta) > 1 else ''}
-            
-            <!-- Saúde Geral -->
-            {f'''
-            <div class="section">
-                <div class="section-header">💊 Saúde Geral</div>
-                <div class="section-content">
-                    <div class="text-content">{pet_data.get('saude', '')}</div>
-                </div>
-            </div>
-            ''' if pet_data.get('saude') else ''}
-            
-            <!-- Alimentação -->
-            {f'''
-            <div class="section">
-                <div class="section-header">🍽️ Alimentação</div>
-                <div class="section-content">
-                    <div class="text-content">{pet_data.get('alimentacao', '')}</div>
-                </div>
-            </div>
-            ''' if pet_data.get('alimentacao') else ''}
-            
-            <!-- História do Pet -->
-            {f'''
-            <div class="section">
-                <div class="section-header">📖 História do Pet</div>
-                <div class="section-content">
-                    <div class="text-content">{pet_data.get('historia', '')}</div>
-                </div>
-            </div>
-            ''' if pet_data.get('historia') else ''}
-            
-            <!-- Exames - Sempre visível -->
-            <div class="section">
-                <div class="section-header">🔬 Exames ({len(exames) if exames else 0})</div>
-                <div class="section-content">
-                    {f'''
-                    <table class="exames-table">
-                        <thead>
-                            <tr>
-                                <th>#</th>
-                                <th>Nome do Exame</th>
-                                <th>Tipo</th>
-                                <th>Data</th>
-                                <th>Acesso</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                            {''.join([f'''
-                            <tr>
-                                <td>{idx}</td>
-                                <td>{exame['nome_exame']}</td>
-                                <td>{'Sangue' if any(palavra in exame['nome_exame'].lower() for palavra in ['sangue', 'hemograma', 'bioquimic']) else 'Raio-X' if any(palavra in exame['nome_exame'].lower() for palavra in ['raio', 'radiograf', 'rx']) else 'Ultrassom' if any(palavra in exame['nome_exame'].lower() for palavra in ['ultra', 'ecograf']) else 'Urina' if any(palavra in exame['nome_exame'].lower() for palavra in ['urina', 'urinalis']) else 'Fezes' if any(palavra in exame['nome_exame'].lower() for palavra in ['fezes', 'parasit']) else 'Cardiológico' if any(palavra in exame['nome_exame'].lower() for palavra in ['cardiologico', 'coração', 'eco']) else 'Oftalmológico' if any(palavra in exame['nome_exame'].lower() for palavra in ['oftalmologic', 'olho', 'visão']) else 'Geral'}</td>
-                                <td>{exame.get("data_upload").date().strftime("%d/%m/%Y") if exame.get("data_upload") and hasattr(exame.get("data_upload"), "date") else str(exame.get("data_upload", ""))[:10] if exame.get("data_upload") else 'N/A'}</td>
-                                <td><a href="{exame.get('url_pdf', '#')}" target="_blank" class="exame-link">📄 Ver PDF</a></td>
-                            </tr>
-                            ''' for idx, exame in enumerate(exames, 1)])}
-                        </tbody>
-                    </table>
-                    
-                    <div style="margin-top: 15px; padding: 10px; background: #f8f9fa; border-radius: 5px; font-size: 12px; color: #666;">
-                        <strong>📋 Nota:</strong> Clique nos links acima para acessar os PDFs dos exames. Cada exame contém informações detalhadas sobre os resultados e conclusões.
-                    </div>
-                    ''' if exames else '''
-                    <div class="no-data-message">
-                        📋 Não consta exame registrado para este pet.
-                    </div>
-                    '''}
-                </div>
-            </div>
-            
-            <!-- Acontecimentos - Sempre visível -->
-            <div class="section">
-                <div class="section-header">📅 Acontecimentos ({len(acontecimentos) if acontecimentos else 0})</div>
-                <div class="section-content">
-                    {f'''
-                    {''.join([f'''
-                    <div class="acontecimento-item">
-                        <div class="acontecimento-layout">
-                            <div class="acontecimento-photo-col">
-                                {f'<img src="{acontecimento.get("url_foto", "")}" alt="Foto do acontecimento" class="acontecimento-photo">' if acontecimento.get('url_foto') else '<div class="acontecimento-photo-placeholder">📷</div>'}
-                            </div>
-                            <div class="acontecimento-info-col">
-                                <div class="acontecimento-header">
-                                    <div class="acontecimento-date">
-                                        {acontecimento.get("data_hora").strftime("%d/%m/%Y as %H:%M") if acontecimento.get("data_hora") and hasattr(acontecimento.get("data_hora"), "strftime") else str(acontecimento.get("data_hora", ""))[:19].replace("T", " as ") if acontecimento.get("data_hora") else 'Data não disponível'}
-                                    </div>
-                                    <div class="acontecimento-number">{idx}</div>
-                                </div>
-                                <div class="text-content">{acontecimento.get('descricao', 'Sem descrição')}</div>
-                            </div>
-                        </div>
-                    </div>
-                    ''' for idx, acontecimento in enumerate(acontecimentos, 1)])}
-                    ''' if acontecimentos else '''
-                    <div class="no-data-message">
-                        📅 Não consta anotação registrada para este pet.
-                    </div>
-                    '''}
-                </div>
-            </div>
-            
-            <!-- Rodapé com Data e Observações lado a lado -->
-            <div class="footer-bottom">
-                <div class="footer-left">
-                    <div class="data-label">📅 Relatório Gerado em</div>
-                    <div class="data-value">{data_atual}</div>
-                </div>
-                
-                <div class="footer-right">
-                    <div class="observacoes-title">💡 Observações</div>
-                    <div class="observacoes-text">
-                        Este relatório foi gerado automaticamente pelo sistema Pelunos. As informações são declarações do tutor e devem ser validadas durante a consulta veterinária.
-                    </div>
-                </div>
-            </div>
-            
-            <!-- Rodapé -->
-            <div class="footer">
-                <div class="footer-info">
-                    Assistente Veterinário Digital<br>
-                    Seu pet mais saudável com um clique de cuidado
-                </div>
-                
-                <div class="footer-brand">
-                    <img src="arquivos/avatar_assistente.png" alt="Pelunos" class="footer-logo-img">
-                    <span class="footer-logo-text">Pelunos</span>
-                </div>
-            </div>
-        </div>
-    </body>
-    </html>
+    templates = _templates_relatorio_html()
+    
+    # Obtém exames e acontecimentos, caso não tenham sido fornecidos
+    if exames is None:
+        exames = obter_exames_pet(pet_data.get('id'))
+    if acontecimentos is None:
+        acontecimentos = obter_acontecimentos_pet(pet_data.get('id'))
+    
+    # Data da última alteração dos dados (o relatório pode ser reaproveitado do cache)
+    data_dados = _data_dados_relatorio(pet_data, exames, acontecimentos)
+    
+    # Foto do pet (menor versão que atende aos 140px do relatório)
+    url_foto = url_foto_pet(pet_data, "relatorio")
+    if url_foto:
+        foto = f'<img src="{url_foto}" alt="{pet_data.get("nome", "Pet")}" class="pet-photo">'
+    else:
+        foto = '<div class="pet-photo-placeholder">🐾</div>'
+    
+    # Seções de texto exibidas apenas quando preenchidas
+    secoes = []
+    if motivo_consulta and len(motivo_consulta) > 1:
+        secoes.append(("🏥 Motivo da Consulta", motivo_consulta))
+    for campo, titulo in (('saude', "💊 Saúde Geral"), ('alimentacao', "🍽️ Alimentação"), ('historia', "📖 História do Pet")):
+        if pet_data.get(campo):
+            secoes.append((titulo, pet_data[campo]))
+    secoes_texto = "".join(templates["relatorio_pet_secao"](titulo=titulo, texto=texto) for titulo, texto in secoes)
+    
+    # Exames
+    if exames:
+        linhas = "".join(
+            templates["relatorio_pet_exame"](
+                numero=idx,
+                nome_exame=exame['nome_exame'],
+                tipo=_tipo_exame_relatorio(exame['nome_exame']),
+                data=_data_upload_relatorio(exame.get("data_upload")),
+                url_pdf=exame.get('url_pdf', '#')
+            )
+            for idx, exame in enumerate(exames, 1)
+        )
+        conteudo_exames = templates["relatorio_pet_exames"](linhas=linhas)
+    else:
+        conteudo_exames = '<div class="no-data-message">📋 Não consta exame registrado para este pet.</div>'
+    
+    # Acontecimentos
+    if acontecimentos:
+        conteudo_acontecimentos = "".join(
+            templates["relatorio_pet_acontecimento"](
+                numero=idx,
+                foto=(f'<img src="{acontecimento["url_foto"]}" alt="Foto do acontecimento" class="acontecimento-photo">'
+                      if acontecimento.get('url_foto') else '<div class="acontecimento-photo-placeholder">📷</div>'),
+                data_hora=_data_hora_relatorio(acontecimento.get("data_hora")),
+                descricao=acontecimento.get('descricao', 'Sem descrição')
+            )
+            for idx, acontecimento in enumerate(acontecimentos, 1)
+        )
+    else:
+        conteudo_acontecimentos = '<div class="no-data-message">📅 Não consta anotação registrada para este pet.</div>'
+    
+    return templates["relatorio_pet"](
+        estilos=templates["estilos"],
+        titulo_nome=pet_data.get('nome', 'Pet'),
+        foto=foto,
+        nome=pet_data.get('nome', 'Não informado'),
+        especie=pet_data.get('especie', 'Não informada'),
+        raca=pet_data.get('raca', 'Não informada'),
+        sexo=pet_data.get('sexo', 'Não informado'),
+        idade=pet_data.get('idade', 'Não informado'),
+        peso=pet_data.get('peso', 'Não informado'),
+        castrado=pet_data.get('castrado', 'Não informado'),
+        secoes_texto=secoes_texto,
+        total_exames=len(exames) if exames else 0,
+        conteudo_exames=conteudo_exames,
+        total_acontecimentos=len(acontecimentos) if acontecimentos else 0,
+        conteudo_acontecimentos=conteudo_acontecimentos,
+        data_dados=data_dados
+    )
+
+# ============================================================================
+# CACHE LOCAL DE ARQUIVOS DO STORAGE
+# ============================================================================
+
+_trava_cache_arquivos = threading.Lock()
+
+def _caminho_cache_arquivo(url):
     """
+    Caminho do arquivo em cache para uma URL. Os arquivos enviados ao Storage
+    recebem nomes únicos, então a URL identifica um conteúdo que não muda.
+    """
+    return os.path.join(CACHE_ARQUIVOS_DIRETORIO, hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+def gravar_arquivo_cache(url, conteudo):
+    """
+    Grava um arquivo no cache em disco e remove os menos usados recentemente
+    se o total passar de CACHE_ARQUIVOS_LIMITE_BYTES.
     
-    return html
+    Args:
+        url: URL do arquivo no Storage (ou outra chave única do conteúdo)
+        conteudo: Bytes do arquivo ou arquivo aberto, lido a partir da posição atual
+    """
+    if not url or conteudo is None:
+        return
+    if isinstance(conteudo, bytes) and len(conteudo) > CACHE_ARQUIVOS_LIMITE_BYTES:
+        return
+    
+    try:
+        os.makedirs(CACHE_ARQUIVOS_DIRETORIO, exist_ok=True)
+        caminho = _caminho_cache_arquivo(url)
+        
+        # Grava em arquivo temporário e renomeia, para nunca expor um arquivo pela metade
+        descritor, temporario = tempfile.mkstemp(dir=CACHE_ARQUIVOS_DIRETORIO, suffix=".tmp")
+        with os.fdopen(descritor, "wb") as arquivo:
+            if isinstance(conteudo, bytes):
+                arquivo.write(conteudo)
+            else:
+                shutil.copyfileobj(conteudo, arquivo)
+        os.replace(temporario, caminho)
+        
+        _limitar_cache_arquivos()
+    except Exception as e:
+        print(f"Erro ao gravar arquivo no cache local: {e}")
+
+def ler_arquivo_cache(chave):
+    """
+    Lê um conteúdo gravado com gravar_arquivo_cache, marcando-o como usado recentemente.
+    
+    Args:
+        chave: URL ou outra chave usada na gravação
+        
+    Returns:
+        bytes: Conteúdo guardado ou None se não estiver no cache
+    """
+    caminho = _caminho_cache_arquivo(chave)
+    try:
+        with open(caminho, "rb") as arquivo:
+            conteudo = arquivo.read()
+        os.utime(caminho)
+        return conteudo
+    except FileNotFoundError:
+        return None
+
+def _limitar_cache_arquivos():
+    """
+    Remove os arquivos menos usados recentemente até o cache caber no limite.
+    """
+    with _trava_cache_arquivos:
+        arquivos = []
+        for entrada in os.scandir(CACHE_ARQUIVOS_DIRETORIO):
+            if entrada.is_file() and not entrada.name.endswith(".tmp"):
+                info = entrada.stat()
+                arquivos.append((info.st_mtime, info.st_size, entrada.path))
+        
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= CACHE_ARQUIVOS_LIMITE_BYTES:
+                break
+            try:
+                os.remove(caminho)
+                total -= tamanho
+            except FileNotFoundError:
+                pass
+
+# ============================================================================
+# DOWNLOAD DOS ARQUIVOS USADOS NOS RELATÓRIOS
+# ============================================================================
+
+@st.cache_resource(show_spinner=False)
+def obter_sessao_http():
+    """
+    Cria uma única sessão HTTP por processo, reaproveitando as conexões
+    (keep-alive) com o Firebase Storage entre downloads e relatórios.
+    
+    Returns:
+        requests.Session: Sessão compartilhada
+    """
+    sessao = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=DOWNLOADS_SIMULTANEOS, pool_maxsize=DOWNLOADS_SIMULTANEOS * 2)
+    sessao.mount("https://", adaptador)
+    sessao.mount("http://", adaptador)
+    return sessao
+
+def _baixar_para_cache(sessao, url):
+    """
+    Garante que o arquivo está no cache em disco, baixando-o em blocos (sem
+    carregá-lo inteiro na memória) com tempos limite próprios de conexão e leitura.
+    Pode ser executada em threads (não usa o Streamlit).
+    
+    Args:
+        sessao: Sessão HTTP compartilhada
+        url: URL do arquivo
+        
+    Returns:
+        str: Caminho do arquivo no cache ou None se o download falhou
+    """
+    caminho = _caminho_cache_arquivo(url)
+    try:
+        os.utime(caminho)
+        return caminho
+    except FileNotFoundError:
+        pass
+    
+    temporario = None
+    try:
+        os.makedirs(CACHE_ARQUIVOS_DIRETORIO, exist_ok=True)
+        with sessao.get(url, stream=True, timeout=(DOWNLOAD_TIMEOUT_CONEXAO_SEGUNDOS, DOWNLOAD_TIMEOUT_LEITURA_SEGUNDOS)) as response:
+            response.raise_for_status()
+            descritor, temporario = tempfile.mkstemp(dir=CACHE_ARQUIVOS_DIRETORIO, suffix=".tmp")
+            with os.fdopen(descritor, "wb") as arquivo:
+                for bloco in response.iter_content(chunk_size=DOWNLOAD_TAMANHO_BLOCO_BYTES):
+                    arquivo.write(bloco)
+        os.replace(temporario, caminho)
+        _limitar_cache_arquivos()
+        return caminho
+    except Exception as e:
+        print(f"Erro ao baixar arquivo {url}: {e}")
+        if temporario and os.path.exists(temporario):
+            os.remove(temporario)
+        return None
+
+def baixar_arquivos_em_disco(urls):
+    """
+    Baixa vários arquivos em paralelo para o cache em disco
+    (no máximo DOWNLOADS_SIMULTANEOS ao mesmo tempo).
+    
+    Args:
+        urls: Lista de URLs (repetidas e vazias são ignoradas)
+        
+    Returns:
+        dict: Mapa {url: caminho no cache ou None se o download falhou}
+    """
+    urls = list(dict.fromkeys(url for url in urls if url))
+    if not urls:
+        return {}
+    
+    sessao = obter_sessao_http()
+    with ThreadPoolExecutor(max_workers=min(DOWNLOADS_SIMULTANEOS, len(urls))) as executor:
+        caminhos = executor.map(lambda url: _baixar_para_cache(sessao, url), urls)
+        return dict(zip(urls, caminhos))
+
+def baixar_arquivos(urls):
+    """
+    Baixa vários arquivos em paralelo (lendo pelo cache em disco) e devolve seus conteúdos.
+    
+    Args:
+        urls: Lista de URLs (repetidas e vazias são ignoradas)
+        
+    Returns:
+        dict: Mapa {url: bytes ou None se o download falhou}
+    """
+    return {url: _ler_arquivo_baixado(caminho) for url, caminho in baixar_arquivos_em_disco(urls).items()}
+
+def _ler_arquivo_baixado(caminho):
+    """
+    Lê um arquivo do cache em disco pelo caminho devolvido no download.
+    
+    Returns:
+        bytes: Conteúdo do arquivo ou None se o download falhou ou o arquivo saiu do cache
+    """
+    if caminho is None:
+        return None
+    try:
+        with open(caminho, "rb") as arquivo:
+            return arquivo.read()
+    except FileNotFoundError:
+        return None
+
+def _conteudo_baixado(arquivos, url):
+    """
+    Retorna o conteúdo já baixado de uma URL ou lança erro se o download falhou,
+    para que o chamador use o mesmo tratamento de erro de antes.
+    """
+    conteudo = _ler_arquivo_baixado(arquivos.get(url))
+    if conteudo is None:
+        raise ValueError(f"arquivo indisponível: {url}")
+    return conteudo
+
+# ============================================================================
+# POOL DE PROCESSOS COMPARTILHADO
+# ============================================================================
+
+@st.cache_resource(show_spinner=False)
+def _obter_executor_processos():
+    """
+    Cria o pool de processos que gera os relatórios e extrai o texto dos PDFs grandes
+    fora da thread do script. Usa 'spawn' para não duplicar (fork) o processo do
+    Streamlit com suas threads.
+    
+    Returns:
+        ProcessPoolExecutor: Pool compartilhado por todas as sessões
+    """
+    return ProcessPoolExecutor(max_workers=PROCESSOS_TRABALHO, mp_context=multiprocessing.get_context("spawn"))
+
+def _descartar_executor_processos(executor):
+    """
+    Descarta o pool quebrado (BrokenProcessPool: um processo de trabalho morreu);
+    o próximo _obter_executor_processos cria um novo. Não faz nada se o pool em uso
+    já não é o quebrado (outra tarefa já o substituiu).
+    """
+    if _obter_executor_processos() is not executor:
+        return
+    _obter_executor_processos.clear()
+    try:
+        executor.shutdown(wait=False, cancel_futures=True)
+    except Exception as e:
+        print(f"Erro ao encerrar pool de processos quebrado: {e}")
+
+def _enviar_para_processos(funcao, *args):
+    """
+    Envia uma função ao pool de processos compartilhado, recriando o pool uma vez
+    se ele estiver quebrado. O pool que quebra durante uma tarefa só é trocado aqui,
+    no próximo envio: os callbacks dos Futures rodam na thread interna do pool, que
+    não pode encerrá-lo.
+    
+    Returns:
+        Future: Future da tarefa
+    """
+    executor = _obter_executor_processos()
+    try:
+        futuro = executor.submit(funcao, *args)
+    except BrokenProcessPool:
+        _descartar_executor_processos(executor)
+        executor = _obter_executor_processos()
+        futuro = executor.submit(funcao, *args)
+    return futuro
+
+# ============================================================================
+# EXTRAÇÃO DE TEXTO DOS PDFs DOS EXAMES
+# ============================================================================
+
+def _extrair_texto_paginas(caminho, inicio, fim):
+    """
+    Extrai o texto das páginas [inicio, fim) de um PDF em disco.
+    Executada nos processos de trabalho.
+    
+    Returns:
+        list: Texto de cada página ("" para páginas sem texto)
+    """
+    leitor = PdfReader(caminho)
+    return [leitor.pages[indice].extract_text() or "" for indice in range(inicio, fim)]
+
+def _extrair_texto_em_processos(conteudo, total_paginas):
+    """
+    Extrai o texto de um PDF grande em paralelo, uma faixa contígua de páginas por
+    processo, a partir de um arquivo temporário.
+    
+    Objetos do pypdf não passam entre processos, então cada processo abre o PDF de novo;
+    abrir só lê a tabela de referências e a árvore de páginas (o conteúdo das páginas é
+    lido sob demanda), e com uma faixa por processo isso acontece no máximo
+    PROCESSOS_TRABALHO vezes, não uma vez a cada poucas páginas.
+    """
+    descritor, caminho = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(descritor, "wb") as arquivo:
+            arquivo.write(conteudo)
+        
+        paginas_por_faixa = -(-total_paginas // PROCESSOS_TRABALHO)
+        faixas = [
+            _enviar_para_processos(_extrair_texto_paginas, caminho, inicio, min(inicio + paginas_por_faixa, total_paginas))
+            for inicio in range(0, total_paginas, paginas_por_faixa)
+        ]
+        return [texto for faixa in faixas for texto in faixa.result()]
+    finally:
+        os.remove(caminho)
+
+def extrair_texto_pdf(conteudo):
+    """
+    Extrai, com o pypdf, o texto de cada página de um PDF.
+    
+    O resultado fica no cache local de arquivos, identificado pelo hash do PDF,
+    então o mesmo arquivo nunca é lido duas vezes. PDFs com PAGINAS_EXTRACAO_PARALELA
+    páginas ou mais são lidos em paralelo pelo pool de processos.
+    
+    Args:
+        conteudo: Bytes do PDF
+        
+    Returns:
+        list: Texto de cada página ("" para páginas sem texto)
+        
+    Raises:
+        Erros do pypdf se o arquivo não for um PDF válido
+    """
+    chave = f"texto_pdf:{hashlib.sha256(conteudo).hexdigest()}"
+    em_cache = ler_arquivo_cache(chave)
+    if em_cache is not None:
+        return json.loads(em_cache)
+    
+    leitor = PdfReader(io.BytesIO(conteudo))
+    total_paginas = len(leitor.pages)
+    
+    paginas = None
+    if total_paginas >= PAGINAS_EXTRACAO_PARALELA:
+        try:
+            paginas = _extrair_texto_em_processos(conteudo, total_paginas)
+        except Exception as e:
+            print(f"Erro na extração em paralelo, lendo o PDF página por página: {e}")
+    if paginas is None:
+        paginas = [pagina.extract_text() or "" for pagina in leitor.pages]
+    
+    gravar_arquivo_cache(chave, json.dumps(paginas, ensure_ascii=False).encode("utf-8"))
+    return paginas
 
 # ============================================================================
 # FUNÇÃO PARA GERAR RELATÓRIO PDF DO PET
 # ============================================================================
 
-def gerar_relatorio_pet_pdf(pet_data, motivo_consulta=""):
+def gerar_relatorio_pet_pdf(pet_data, motivo_consulta="", exames=None, acontecimentos=None, destino=None, ao_progredir=None):
     """
     Gera um relatório PDF completo do pet para veterinário, incluindo exames.
     
+    Os PDFs dos exames são lidos do cache em disco e o relatório é montado em arquivos
+    temporários (SpooledTemporaryFile), que só ficam na memória até RELATORIO_LIMITE_MEMORIA_BYTES.
+    
     Args:
         pet_data: Dicionário com dados do pet
+        motivo_consulta: Motivo da consulta (opcional)
+        exames: Lista de exames já carregada (opcional, consulta o Firestore se None)
+        acontecimentos: Lista de acontecimentos já carregada (opcional, consulta o Firestore se None)
+        destino: Caminho onde gravar o PDF (opcional); se informado, o relatório vai direto
+                 do arquivo temporário para o disco, sem passar inteiro pela memória
+        ao_progredir: Função chamada com o nome de cada etapa ("download", "renderizacao", "juncao")
         
     Returns:
-        bytes: Conteúdo do PDF em bytes
+        bytes: Conteúdo do PDF em bytes (ou o caminho gravado, se destino for informado)
     """
-    # Buffer em memória para o PDF
-    buffer = io.BytesIO()
+    ao_progredir = ao_progredir or (lambda etapa: None)
+    
+    if exames is None:
+        exames = obter_exames_pet(pet_data.get('id'))
+    if acontecimentos is None:
+        acontecimentos = obter_acontecimentos_pet(pet_data.get('id'))
+    
+    # Baixa de uma vez, em paralelo, todas as fotos e PDFs usados no relatório
+    ao_progredir("download")
+    url_foto = url_foto_pet(pet_data, "relatorio")
+    arquivos = baixar_arquivos_em_disco(
+        [url_foto]
+        + [acontecimento.get('url_foto') for acontecimento in acontecimentos]
+        + [exame.get('url_pdf') for exame in exames]
+    )
+    
+    # Arquivo temporário para o PDF (em memória enquanto for pequeno)
+    ao_progredir("renderizacao")
+    buffer = tempfile.SpooledTemporaryFile(max_size=RELATORIO_LIMITE_MEMORIA_BYTES)
     
     # Cria o documento PDF
     doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
@@ -1383,28 +1875,18 @@ def gerar_relatorio_pet_pdf(pet_data, motivo_consulta=""):
     story.append(Spacer(1, 20))
     
     # Foto do pet (se disponível)
-    if pet_data.get('url_foto'):
+    if url_foto:
         try:
-            # Baixa a imagem do Firebase Storage
-            response = requests.get(pet_data['url_foto'], timeout=30)
-            response.raise_for_status()
-            
-            # Cria um objeto de imagem PIL para redimensionar
-            img_pil = Image.open(io.BytesIO(response.content))
+            # Versão "relatorio" já baixada do Firebase Storage, usada sem reprocessar
+            img_bytes = _conteudo_baixado(arquivos, url_foto)
             
-            # Redimensiona a imagem mantendo proporção (máx 150x150px)
-            img_pil.thumbnail((150, 150), Image.Resampling.LANCZOS)
+            # Ajusta apenas o tamanho de desenho mantendo proporção (máx 150x150px)
+            largura_original, altura_original = ImageReader(io.BytesIO(img_bytes)).getSize()
+            escala = min(1, 150 / max(largura_original, altura_original))
+            img_width, img_height = largura_original * escala, altura_original * escala
             
-            # Converte para formato que o ReportLab pode usar
-            img_buffer = io.BytesIO()
-            img_pil.save(img_buffer, format='PNG')
-            img_buffer.seek(0)
-            
-            # Adiciona a imagem ao PDF
-            img_width, img_height = img_pil.size
-            
-            # Cria a imagem para o ReportLab diretamente do buffer
-            pet_image = ReportLabImage(img_buffer, width=img_width, height=img_height)
+            # Cria a imagem para o ReportLab diretamente dos bytes baixados
+            pet_image = ReportLabImage(io.BytesIO(img_bytes), width=img_width, height=img_height)
             
             # Prepara os dados básicos para a tabela
             dados_basicos = [
@@ -1549,12 +2031,11 @@ def gerar_relatorio_pet_pdf(pet_data, motivo_consulta=""):
         story.append(Paragraph(pet_data['historia'], styles['Normal']))
         story.append(Spacer(1, 15))
     
-    # Data do relatório
-        data_relatorio = datetime.now().strftime("%d/%m/%Y as %H:%M")
-    story.append(Paragraph(f"Relatório gerado em: {data_relatorio}", styles['Normal']))
+    # Data da última alteração dos dados (o relatório pode ser reaproveitado do cache)
+    data_dados = _data_dados_relatorio(pet_data, exames, acontecimentos)
+    story.append(Paragraph(f"Dados atualizados em: {data_dados}", styles['Normal']))
     story.append(Spacer(1, 20))
     # Seção de Exames
-    exames = obter_exames_pet(pet_data.get('id'))
     if exames:
         story.append(Paragraph(f"EXAMES ({len(exames)})", subtitulo_style))
         
@@ -1628,7 +2109,6 @@ def gerar_relatorio_pet_pdf(pet_data, motivo_consulta=""):
         story.append(Spacer(1, 15))
     
     # Seção de Acontecimentos
-    acontecimentos = obter_acontecimentos_pet(pet_data.get('id'))
     if acontecimentos:
         story.append(Paragraph(f"ACONTECIMENTOS ({len(acontecimentos)})", subtitulo_style))
         
@@ -1668,12 +2148,8 @@ def gerar_relatorio_pet_pdf(pet_data, motivo_consulta=""):
             # Foto do acontecimento (se houver)
             if acontecimento.get('url_foto'):
                 try:
-                    # Baixa a imagem do Firebase Storage
-                    response = requests.get(acontecimento['url_foto'], timeout=30)
-                    response.raise_for_status()
-                    
-                    # Cria um objeto de imagem PIL para redimensionar
-                    img_pil = Image.open(io.BytesIO(response.content))
+                    # Imagem já baixada do Firebase Storage
+                    img_pil = Image.open(io.BytesIO(_conteudo_baixado(arquivos, acontecimento['url_foto'])))
                     
                     # Redimensiona a imagem mantendo proporção (máx 80x80px para layout lado a lado)
                     img_pil.thumbnail((80, 80), Image.Resampling.LANCZOS)
@@ -1738,103 +2214,467 @@ def gerar_relatorio_pet_pdf(pet_data, motivo_consulta=""):
     
     # Gera o PDF do relatório principal
     doc.build(story)
+    buffer.seek(0)
     
-    # Obtém os exames para fazer merge com os PDFs
-    exames = obter_exames_pet(pet_data.get('id'))
-    
+    # Sem exames, não há PDFs para fazer merge
     if not exames:
         # Se não há exames, retorna apenas o relatório principal
-        buffer.seek(0)
-        return buffer.getvalue()
+        return _entregar_relatorio(buffer, destino)
     
+    ao_progredir("juncao")
     try:
         # Cria um PdfWriter para o documento final
         pdf_writer = PdfWriter()
         
         # Adiciona o relatório principal
-        buffer.seek(0)
         relatorio_reader = PdfReader(buffer)
         for page in relatorio_reader.pages:
             pdf_writer.add_page(page)
         
-        # Para cada exame, baixa o PDF e anexa
-        exames_anexados = 0
+        # Abre os PDFs dos exames direto do cache em disco, sem copiá-los para a memória
+        exames_abertos = []
+        exames_legiveis = []
         for idx, exame in enumerate(exames, 1):
             if not exame.get('url_pdf'):
                 continue
                 
             try:
-                # Baixa o PDF do exame
-                response = requests.get(exame['url_pdf'], timeout=30)
-                response.raise_for_status()
-                
-                # Lê o PDF baixado
-                exame_buffer = io.BytesIO(response.content)
-                exame_reader = PdfReader(exame_buffer)
-                
-                # Adiciona uma página de separação/título para o exame
-                separador_buffer = io.BytesIO()
-                separador_doc = SimpleDocTemplate(separador_buffer, pagesize=A4)
-                separador_styles = getSampleStyleSheet()
+                caminho_exame = arquivos.get(exame['url_pdf'])
+                if caminho_exame is None:
+                    raise ValueError(f"arquivo indisponível: {exame['url_pdf']}")
+                exame_arquivo = open(caminho_exame, "rb")
+                exames_abertos.append(exame_arquivo)
+                exames_legiveis.append((idx, exame, PdfReader(exame_arquivo)))
                 
-                separador_title_style = ParagraphStyle(
-                    'SeparadorTitle',
-                    parent=separador_styles['Heading1'],
-                    fontSize=16,
-                    spaceAfter=30,
-                    alignment=1,  # Centralizado
-                    textColor=colors.HexColor('#1976D2')
-                )
-                
-                separador_story = []
-                separador_story.append(Spacer(1, 2*inch))
-                separador_story.append(Paragraph(f"EXAME {idx}: {exame['nome_exame']}", separador_title_style))
-                
-                # Data do exame
-                if exame["data_upload"]:
-                    try:
-                        if hasattr(exame["data_upload"], "date"):
-                            data_formatada = exame["data_upload"].date().strftime("%d/%m/%Y")
-                        else:
-                            data_formatada = str(exame["data_upload"])[:10]
-                        separador_story.append(Paragraph(f"Data de Upload: {data_formatada}", separador_styles['Normal']))
-                    except:
-                        pass
-                
-                separador_story.append(Spacer(1, 1*inch))
-                separador_story.append(Paragraph("Arquivo original anexado abaixo:", separador_styles['Normal']))
-                
-                separador_doc.build(separador_story)
-                
-                # Adiciona a página de separação
-                separador_buffer.seek(0)
-                separador_reader = PdfReader(separador_buffer)
-                for page in separador_reader.pages:
-                    pdf_writer.add_page(page)
+            except Exception as e:
+                print(f"Erro ao anexar exame '{exame['nome_exame']}': {e}")
+                # Continua com os outros exames mesmo se um falhar
+                continue
+        
+        # Todas as páginas de separação saem de uma única construção do ReportLab (uma página por exame)
+        separadores = _gerar_paginas_separadoras([(idx, exame) for idx, exame, _ in exames_legiveis])
+        
+        for posicao, (idx, exame, exame_reader) in enumerate(exames_legiveis):
+            try:
+                # Adiciona a página de separação deste exame
+                if separadores is not None:
+                    pdf_writer.add_page(separadores.pages[posicao])
                 
                 # Adiciona as páginas do exame
                 for page in exame_reader.pages:
                     pdf_writer.add_page(page)
                 
-                exames_anexados += 1
-                
             except Exception as e:
                 print(f"Erro ao anexar exame '{exame['nome_exame']}': {e}")
-                # Continua com os outros exames mesmo se um falhar
                 continue
         
-        # Gera o PDF final com todos os exames anexados
-        final_buffer = io.BytesIO()
-        pdf_writer.write(final_buffer)
-        final_buffer.seek(0)
+        # Grava o PDF final com todos os exames anexados em outro arquivo temporário
+        final_buffer = tempfile.SpooledTemporaryFile(max_size=RELATORIO_LIMITE_MEMORIA_BYTES)
+        try:
+            pdf_writer.write(final_buffer)
+        finally:
+            for exame_arquivo in exames_abertos:
+                exame_arquivo.close()
         
-        return final_buffer.getvalue()
+        buffer.close()
+        final_buffer.seek(0)
+        return _entregar_relatorio(final_buffer, destino)
         
     except Exception as e:
         print(f"Erro ao fazer merge dos PDFs: {e}")
         # Em caso de erro no merge, retorna apenas o relatório principal
         buffer.seek(0)
-        return buffer.getvalue()
+        return _entregar_relatorio(buffer, destino)
+
+def _gerar_paginas_separadoras(itens):
+    """
+    Gera, em um único documento, as páginas de identificação que antecedem cada exame
+    anexado ao relatório PDF: uma página por exame, na mesma ordem de `itens`.
+    
+    Args:
+        itens: Lista de tuplas (número do exame, dicionário do exame)
+        
+    Returns:
+        PdfReader: Leitor do documento com as páginas separadoras, ou None se não foi
+                   possível gerar exatamente uma página por exame
+    """
+    if not itens:
+        return None
+    
+    separador_styles = getSampleStyleSheet()
+    separador_title_style = ParagraphStyle(
+        'SeparadorTitle',
+        parent=separador_styles['Heading1'],
+        fontSize=16,
+        spaceAfter=30,
+        alignment=1,  # Centralizado
+        textColor=colors.HexColor('#1976D2')
+    )
+    
+    separador_story = []
+    for posicao, (idx, exame) in enumerate(itens):
+        if posicao > 0:
+            separador_story.append(PageBreak())
+        
+        separador_story.append(Spacer(1, 2*inch))
+        separador_story.append(Paragraph(f"EXAME {idx}: {exame['nome_exame']}", separador_title_style))
+        
+        # Data do exame
+        if exame.get("data_upload"):
+            try:
+                if hasattr(exame["data_upload"], "date"):
+                    data_formatada = exame["data_upload"].date().strftime("%d/%m/%Y")
+                else:
+                    data_formatada = str(exame["data_upload"])[:10]
+                separador_story.append(Paragraph(f"Data de Upload: {data_formatada}", separador_styles['Normal']))
+            except:
+                pass
+        
+        separador_story.append(Spacer(1, 1*inch))
+        separador_story.append(Paragraph("Arquivo original anexado abaixo:", separador_styles['Normal']))
+    
+    try:
+        separador_buffer = io.BytesIO()
+        SimpleDocTemplate(separador_buffer, pagesize=A4).build(separador_story)
+        separador_buffer.seek(0)
+        separadores = PdfReader(separador_buffer)
+    except Exception as e:
+        print(f"Erro ao gerar as páginas de separação dos exames: {e}")
+        return None
+    
+    # As páginas são associadas aos exames pela posição; qualquer quebra extra desalinharia tudo
+    if len(separadores.pages) != len(itens):
+        print(f"Páginas de separação inesperadas: {len(separadores.pages)} para {len(itens)} exames")
+        return None
+    return separadores
+
+def _entregar_relatorio(arquivo, destino):
+    """
+    Devolve o relatório como bytes ou, se destino for informado, copia-o em blocos para
+    esse caminho e devolve o caminho. O arquivo temporário de trabalho é sempre fechado.
+    """
+    with arquivo:
+        if destino is None:
+            return arquivo.read()
+        with open(destino, "wb") as saida:
+            shutil.copyfileobj(arquivo, saida)
+    return destino
+
+# ============================================================================
+# CACHE DE RELATÓRIOS GERADOS
+# ============================================================================
+
+def _impressao_digital_relatorio(formato, pet_data, motivo_consulta, exames, acontecimentos):
+    """
+    Calcula a impressão digital de um relatório: muda sempre que o documento do pet,
+    os exames, os acontecimentos, o motivo da consulta ou o layout mudarem.
+    
+    Returns:
+        str: Hash SHA-256 em hexadecimal
+    """
+    dados = {
+        "versao": RELATORIO_VERSAO,
+        "formato": formato,
+        "pet": {chave: valor for chave, valor in pet_data.items() if chave not in ("exames", "acontecimentos")},
+        "exames": [(exame.get("id"), exame.get("data_atualizacao")) for exame in exames],
+        "acontecimentos": [(acontecimento.get("id"), acontecimento.get("data_atualizacao")) for acontecimento in acontecimentos],
+        "motivo_consulta": motivo_consulta
+    }
+    conteudo = json.dumps(dados, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+def gerar_relatorio_pet(pet_data, motivo_consulta="", formato="html", exames=None, acontecimentos=None, destino=None, ao_progredir=None):
+    """
+    Retorna o relatório do pet, reaproveitando o já gerado se nada mudou desde então.
+    
+    Os relatórios ficam no cache local de arquivos (mesmo limite de tamanho e remoção
+    dos menos usados), identificados pela impressão digital dos dados usados.
+    
+    Args:
+        pet_data: Dicionário com dados do pet
+        motivo_consulta: Motivo da consulta (opcional)
+        formato: "html" ou "pdf"
+        exames: Lista de exames já carregada (opcional, consulta o Firestore se None)
+        acontecimentos: Lista de acontecimentos já carregada (opcional, consulta o Firestore se None)
+        destino: Caminho onde gravar o PDF (obrigatório quando formato="pdf")
+        ao_progredir: Função chamada com o nome de cada etapa da geração (opcional)
+        
+    Returns:
+        str: Conteúdo HTML do relatório, ou o caminho do PDF gravado em destino
+    """
+    if exames is None:
+        exames = obter_exames_pet(pet_data.get('id'))
+    if acontecimentos is None:
+        acontecimentos = obter_acontecimentos_pet(pet_data.get('id'))
+    
+    chave = f"relatorio:{_impressao_digital_relatorio(formato, pet_data, motivo_consulta, exames, acontecimentos)}"
+    caminho = _caminho_cache_arquivo(chave)
+    
+    # Relatório já gerado com os mesmos dados
+    try:
+        if formato == "pdf":
+            shutil.copyfile(caminho, destino)
+            os.utime(caminho)
+            return destino
+        with open(caminho, "rb") as arquivo:
+            html = arquivo.read().decode("utf-8")
+        os.utime(caminho)
+        return html
+    except FileNotFoundError:
+        pass
+    
+    if formato == "pdf":
+        gerar_relatorio_pet_pdf(pet_data, motivo_consulta, exames, acontecimentos, destino=destino, ao_progredir=ao_progredir)
+        with open(destino, "rb") as arquivo:
+            gravar_arquivo_cache(chave, arquivo)
+        return destino
+    
+    if ao_progredir:
+        ao_progredir("renderizacao")
+    html = gerar_relatorio_pet_html(pet_data, motivo_consulta, exames, acontecimentos)
+    gravar_arquivo_cache(chave, html.encode("utf-8"))
+    return html
+
+# ============================================================================
+# GERAÇÃO DE RELATÓRIOS EM SEGUNDO PLANO
+# ============================================================================
+
+def _finalizar_tarefa_relatorio(diretorio, futuro):
+    """
+    Chamada quando o Future de uma tarefa termina. Se a tarefa nem chegou a gravar seu
+    status final (processo morto, pool quebrado, tarefa cancelada), marca-a como "erro".
+    """
+    try:
+        erro = futuro.exception()
+    except CancelledError as e:
+        erro = e
+    if erro is None:
+        return
+    
+    print(f"Erro no processo de geração do relatório: {erro!r}")
+    try:
+        _gravar_status_tarefa(diretorio, "erro", mensagem=str(erro) or type(erro).__name__)
+    except OSError:
+        # Pasta da tarefa já removida
+        pass
+
+def _enviar_tarefa_relatorio(diretorio, *args):
+    """
+    Envia _executar_tarefa_relatorio ao pool de processos e acompanha o Future até o fim.
+    
+    Returns:
+        Future: Future da tarefa
+    """
+    futuro = _enviar_para_processos(_executar_tarefa_relatorio, diretorio, *args)
+    futuro.add_done_callback(functools.partial(_finalizar_tarefa_relatorio, diretorio))
+    return futuro
+
+def _gravar_status_tarefa(diretorio, etapa, **extras):
+    """
+    Grava o status de uma tarefa de relatório (status.json na pasta da tarefa).
+    Executada no processo de trabalho; a interface apenas lê o arquivo.
+    """
+    status = {"etapa": etapa, "atualizado_em": time.time(), **extras}
+    temporario = os.path.join(diretorio, "status.json.tmp")
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(status, arquivo)
+    os.replace(temporario, os.path.join(diretorio, "status.json"))
+
+def _ler_status_tarefa(diretorio):
+    """
+    Lê o status.json da pasta de uma tarefa de relatório (None se a pasta não existe mais).
+    """
+    try:
+        with open(os.path.join(diretorio, "status.json"), encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def _executar_tarefa_relatorio(diretorio, pet_data, motivo_consulta, formato, exames, acontecimentos):
+    """
+    Gera um relatório no processo de trabalho e guarda o arquivo final na pasta da tarefa.
+    Não usa st.user nem st.session_state: todos os dados chegam como argumentos.
+    """
+    try:
+        caminho = os.path.join(diretorio, f"relatorio.{formato}")
+        relatorio = gerar_relatorio_pet(
+            pet_data,
+            motivo_consulta=motivo_consulta,
+            formato=formato,
+            exames=exames,
+            acontecimentos=acontecimentos,
+            destino=caminho,
+            ao_progredir=lambda etapa: _gravar_status_tarefa(diretorio, etapa)
+        )
+        
+        # O PDF já foi gravado em caminho; o HTML volta como texto
+        if formato == "html":
+            with open(caminho, "w", encoding="utf-8") as arquivo:
+                arquivo.write(relatorio)
+        
+        _gravar_status_tarefa(diretorio, "concluido", arquivo=caminho)
+    except Exception as e:
+        print(f"Erro ao gerar relatório em segundo plano: {e}")
+        _gravar_status_tarefa(diretorio, "erro", mensagem=str(e))
+
+def _limpar_tarefas_relatorio_antigas():
+    """
+    Remove as pastas de tarefas (e seus relatórios) mais antigas que RELATORIOS_RETENCAO_SEGUNDOS.
+    """
+    limite = time.time() - RELATORIOS_RETENCAO_SEGUNDOS
+    try:
+        for entrada in os.scandir(RELATORIOS_DIRETORIO):
+            if entrada.is_dir() and entrada.stat().st_mtime < limite:
+                shutil.rmtree(entrada.path, ignore_errors=True)
+    except FileNotFoundError:
+        pass
+
+def enviar_relatorio_pet(pet_data, motivo_consulta="", formato="html", exames=None, acontecimentos=None):
+    """
+    Envia a geração de um relatório para o pool de processos e retorna imediatamente.
+    O andamento é consultado com obter_status_relatorio.
+    
+    Args:
+        pet_data: Dicionário com dados do pet
+        motivo_consulta: Motivo da consulta (opcional)
+        formato: "html" ou "pdf"
+        exames: Lista de exames já carregada (opcional, consulta o Firestore se None)
+        acontecimentos: Lista de acontecimentos já carregada (opcional, consulta o Firestore se None)
+        
+    Returns:
+        str: ID da tarefa ou None se não foi possível enviá-la
+    """
+    if exames is None:
+        exames = obter_exames_pet(pet_data.get('id'))
+    if acontecimentos is None:
+        acontecimentos = obter_acontecimentos_pet(pet_data.get('id'))
+    
+    _limpar_tarefas_relatorio_antigas()
+    
+    tarefa_id = uuid.uuid4().hex
+    diretorio = os.path.join(RELATORIOS_DIRETORIO, tarefa_id)
+    try:
+        os.makedirs(diretorio)
+        _gravar_status_tarefa(diretorio, "fila")
+        
+        # O pet carregado pelo painel traz exames e acontecimentos junto; só os dados do pet vão no documento
+        dados_pet = {chave: valor for chave, valor in pet_data.items() if chave not in ("exames", "acontecimentos")}
+        _enviar_tarefa_relatorio(diretorio, dados_pet, motivo_consulta, formato, exames, acontecimentos)
+        return tarefa_id
+    except Exception as e:
+        print(f"Erro ao enviar relatório para geração em segundo plano: {e}")
+        shutil.rmtree(diretorio, ignore_errors=True)
+        return None
+
+def _montar_zip_exportacao(diretorio, futuros):
+    """
+    Acrescenta ao ZIP da exportação cada relatório assim que seu processo termina,
+    lendo do disco (nenhum relatório é mantido inteiro na memória). Roda em uma thread.
+    
+    Args:
+        diretorio: Pasta da tarefa de exportação
+        futuros: Mapa {Future: (pasta da tarefa do pet, nome do arquivo dentro do ZIP)}
+    """
+    caminho_zip = os.path.join(diretorio, "relatorios_pets.zip")
+    concluidos = 0
+    try:
+        with zipfile.ZipFile(caminho_zip, "w") as arquivo_zip:
+            for futuro in as_completed(futuros):
+                diretorio_pet, nome_arquivo = futuros[futuro]
+                status = _ler_status_tarefa(diretorio_pet) or {}
+                
+                if status.get("etapa") == "concluido":
+                    # PDFs já são comprimidos; só o HTML ganha com deflate
+                    compressao = zipfile.ZIP_STORED if nome_arquivo.endswith(".pdf") else zipfile.ZIP_DEFLATED
+                    arquivo_zip.write(status["arquivo"], arcname=nome_arquivo, compress_type=compressao)
+                else:
+                    print(f"Relatório não incluído na exportação: {nome_arquivo}")
+                shutil.rmtree(diretorio_pet, ignore_errors=True)
+                
+                concluidos += 1
+                _gravar_status_tarefa(diretorio, "renderizacao", concluidos=concluidos, total=len(futuros))
+        
+        _gravar_status_tarefa(diretorio, "concluido", arquivo=caminho_zip)
+    except Exception as e:
+        print(f"Erro ao montar a exportação dos relatórios: {e}")
+        _gravar_status_tarefa(diretorio, "erro", mensagem=str(e))
+
+def nome_arquivo_seguro(nome, padrao="pet"):
+    """
+    Reduz um texto do usuário (ex: nome do pet) a letras, números, espaço, "_" e "-",
+    para uso em nomes de arquivo e entradas de ZIP sem barras, ".." ou caracteres de controle.
+    
+    Args:
+        nome: Texto original
+        padrao: Valor usado se nada sobrar após a limpeza
+        
+    Returns:
+        str: Nome seguro
+    """
+    return re.sub(r"[^\w\- ]", "", str(nome or "")).strip() or padrao
+
+def enviar_exportacao_pets(pets):
+    """
+    Gera os relatórios de todos os pets em paralelo, no pool de processos, e os reúne em um ZIP.
+    Pets com exames recebem o PDF com os exames anexados; os demais, o relatório HTML.
+    O andamento é consultado com obter_status_relatorio (campos 'concluidos' e 'total').
+    
+    Args:
+        pets: Lista de pets já carregada com 'exames' e 'acontecimentos' (ex: carregar_painel_pets)
+        
+    Returns:
+        str: ID da tarefa ou None se não foi possível enviá-la
+    """
+    _limpar_tarefas_relatorio_antigas()
+    
+    tarefa_id = uuid.uuid4().hex
+    diretorio = os.path.join(RELATORIOS_DIRETORIO, tarefa_id)
+    try:
+        os.makedirs(diretorio)
+        _gravar_status_tarefa(diretorio, "renderizacao", concluidos=0, total=len(pets))
+        
+        futuros = {}
+        for pet in pets:
+            exames = pet.get('exames') or []
+            acontecimentos = pet.get('acontecimentos') or []
+            formato = "pdf" if exames else "html"
+            dados_pet = {chave: valor for chave, valor in pet.items() if chave not in ("exames", "acontecimentos")}
+            
+            diretorio_pet = os.path.join(diretorio, pet['id'])
+            os.makedirs(diretorio_pet)
+            nome_arquivo = f"relatorio_{nome_arquivo_seguro(pet.get('nome'))}_{pet['id'][:6]}.{formato}"
+            futuro = _enviar_tarefa_relatorio(diretorio_pet, dados_pet, "", formato, exames, acontecimentos)
+            futuros[futuro] = (diretorio_pet, nome_arquivo)
+        
+        threading.Thread(target=_montar_zip_exportacao, args=(diretorio, futuros), daemon=True).start()
+        return tarefa_id
+    except Exception as e:
+        print(f"Erro ao enviar a exportação dos relatórios: {e}")
+        shutil.rmtree(diretorio, ignore_errors=True)
+        return None
+
+def obter_status_relatorio(tarefa_id):
+    """
+    Lê o status de uma tarefa de relatório.
+    
+    Args:
+        tarefa_id: ID retornado por enviar_relatorio_pet
+        
+    Returns:
+        dict: Status com 'etapa' ("fila", "download", "renderizacao", "juncao", "concluido" ou "erro"),
+              'concluidos' e 'total' nas exportações de vários pets e, quando concluído, o caminho
+              do arquivo em 'arquivo'. None se a tarefa não existe mais.
+    """
+    diretorio = os.path.join(RELATORIOS_DIRETORIO, tarefa_id)
+    status = _ler_status_tarefa(diretorio)
+    
+    # Tarefa parada numa etapa intermediária há tempo demais: o processo que a gerava se perdeu
+    if (status is not None and status["etapa"] not in ("concluido", "erro")
+            and time.time() - status.get("atualizado_em", 0) > RELATORIOS_TEMPO_LIMITE_SEGUNDOS):
+        print(f"Tarefa de relatório {tarefa_id} sem andamento desde a etapa '{status['etapa']}'")
+        _gravar_status_tarefa(diretorio, "erro", mensagem="Tempo limite excedido")
+        status = _ler_status_tarefa(diretorio)
+    return status
 
 # ============================================================================
 # FUNÇÕES PARA GERENCIAMENTO DE EXAMES DOS PETS
@@ -1871,7 +2711,7 @@ def fazer_upload_exame_pet(arquivo_pdf, pet_id, nome_exame):
         
         # Upload para Firebase Storage
         print("Conectando ao Firebase Storage...")
-        bucket = storage.bucket()
+        bucket = obter_bucket()
         print(f"🔍 BUCKET OBTIDO: {bucket.name}")
         
         blob = bucket.blob(nome_arquivo)
@@ -1889,6 +2729,11 @@ def fazer_upload_exame_pet(arquivo_pdf, pet_id, nome_exame):
         url_publica = blob.public_url
         print(f"Upload concluído com sucesso! URL: {url_publica}")
         
+        # Relatórios e o relator leem o exame pelo cache local, sem baixá-lo de novo
+        arquivo_pdf.seek(0)
+        gravar_arquivo_cache(url_publica, arquivo_pdf.read())
+        arquivo_pdf.seek(0)
+        
         return url_publica
         
     except Exception as e:
@@ -1912,19 +2757,22 @@ def salvar_exame_pet(pet_id, nome_exame, url_pdf):
     if not hasattr(st.user, 'email'):
         return None
         
-    db = firestore.client()
+    db = obter_db()
     exames_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("pets").document(pet_id).collection("exames")
     
     try:
         dados_exame = {
             "nome_exame": nome_exame,
             "url_pdf": url_pdf,
+            "status": "enviado",  # upload concluído; a análise do relator segue em segundo plano
+            "status_atualizado_em": datetime.now(),
             "data_upload": datetime.now(),
             "data_atualizacao": datetime.now()
         }
         
         print(f"Salvando exame com dados: {dados_exame}")
         doc_ref = exames_ref.add(dados_exame)
+        invalidar_cache(("exames", pet_id))
         return doc_ref[1].id  # Retorna o ID do documento criado
     except Exception as e:
         print(f"Erro ao salvar exame: {e}")
@@ -1945,7 +2793,7 @@ def listar_arquivos_pet_storage(pet_id, tipo_arquivo=""):
         return []
         
     try:
-        bucket = storage.bucket()
+        bucket = obter_bucket()
         
         # Define o prefixo baseado na nova estrutura hierárquica
         if tipo_arquivo:
@@ -1973,6 +2821,36 @@ def listar_arquivos_pet_storage(pet_id, tipo_arquivo=""):
         print(f"Erro ao listar arquivos do pet {pet_id}: {e}")
         return []
 
+def _consultar_exames_pet(db, email, pet_id):
+    """
+    Consulta os exames de um pet no Firestore, do mais recente para o mais antigo.
+    Não depende de st.user, podendo ser executada fora da thread do script.
+    
+    Args:
+        db: Cliente do Firestore
+        email: Email do usuário dono do pet
+        pet_id: ID do pet
+        
+    Returns:
+        list: Lista de dicionários com dados dos exames
+    """
+    exames_ref = db.collection(COLECAO_USUARIOS).document(email).collection("pets").document(pet_id).collection("exames")
+    docs = exames_ref.order_by("data_upload", direction=firestore.Query.DESCENDING).get()
+    
+    exames = []
+    for doc in docs:
+        exame_data = doc.to_dict()
+        exames.append({
+            "id": doc.id,
+            "nome_exame": exame_data.get("nome_exame", "Exame sem nome"),
+            "url_pdf": exame_data.get("url_pdf", ""),
+            "data_upload": exame_data.get("data_upload"),
+            "data_atualizacao": exame_data.get("data_atualizacao"),
+            "status": exame_data.get("status"),
+            "status_atualizado_em": exame_data.get("status_atualizado_em")
+        })
+    return exames
+
 def obter_exames_pet(pet_id):
     """
     Obtém a lista de exames de um pet específico.
@@ -1985,86 +2863,157 @@ def obter_exames_pet(pet_id):
     """
     if not hasattr(st.user, 'email'):
         return []
+    
+    exames = _cache_ler(("exames", pet_id))
+    if exames is not None:
+        return exames
         
-    db = firestore.client()
-    exames_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("pets").document(pet_id).collection("exames")
+    db = obter_db()
     
     try:
-        docs = exames_ref.order_by("data_upload", direction=firestore.Query.DESCENDING).get()
-        exames = []
-        
-        for doc in docs:
-            exame_data = doc.to_dict()
-            exame_dict = {
-                "id": doc.id,
-                "nome_exame": exame_data.get("nome_exame", "Exame sem nome"),
-                "url_pdf": exame_data.get("url_pdf", ""),
-                "data_upload": exame_data.get("data_upload"),
-                "data_atualizacao": exame_data.get("data_atualizacao")
-            }
-            exames.append(exame_dict)
-            
+        exames = _consultar_exames_pet(db, st.user.email, pet_id)
+        _cache_gravar(("exames", pet_id), exames)
         return exames
     except Exception as e:
         print(f"Erro ao obter exames do pet {pet_id}: {e}")
         return []
 
-def obter_info_exames(pets):
+def _resumo_exame(exame_data, data_upload=None):
     """
-    Obtém todos os resumos, feitos pelo agente de IA, dos exames dos pets do usuário
-    e formata tudo em uma única string de contexto.
+    Extrai do documento de exame apenas os campos usados no contexto do chatbot.
     
     Args:
-        pets: lista de dicionários de pets (cada um contendo pelo menos 'id' e 'nome')
+        exame_data: Dicionário com os dados do exame (campos preenchidos pelo relator)
+        data_upload: Data de upload do exame, usada para ordená-los, quando não está em exame_data
         
     Returns:
-        str: Uma string formatada com os dados dos exames de todos os pets.
+        dict: Resumo do exame guardado no documento do usuário
     """
-    # SUGESTÃO 1: Retornar string vazia para consistência.
-    if not hasattr(st.user, 'email'):
-        return ""
+    return {
+        "tipo_exame": exame_data.get("tipo_exame", "Não informado"),
+        "data_exame": exame_data.get("data_exame", "Não informada"),
+        "resultado_exame": exame_data.get("resultado_exame", "Não informado"),
+        "mini_relatorio": exame_data.get("mini_relatorio", "Nenhum resumo disponível."),
+        "data_upload": exame_data.get("data_upload", data_upload)
+    }
+
+def registrar_resumo_exame(email, pet_id, exame_id, exame_data, data_upload=None):
+    """
+    Atualiza de forma incremental o resumo de um exame no campo `resumos_exames`
+    do documento do usuário (chamada pelo relator após extrair os dados do laudo).
+    
+    Não depende de st.user nem da sessão, podendo ser executada fora da thread do
+    script; quem acompanha a análise invalida ("usuario",) ao vê-la concluída.
+    
+    Args:
+        email: Email do usuário dono do pet
+        pet_id: ID do pet
+        exame_id: ID do documento do exame
+        exame_data: Dicionário com os campos extraídos do exame
+        data_upload: Data de upload gravada no documento do exame
         
-    db = firestore.client()
-    texto = ""
+    Returns:
+        bool: True se o resumo foi gravado (ou ficará para a reconstrução inicial), False em erro
+    """
+    try:
+        usuario_ref = obter_db().collection(COLECAO_USUARIOS).document(email)
+        
+        # Enquanto o resumo nunca foi montado, a reconstrução completa já incluirá este exame
+        usuario = usuario_ref.get(field_paths=["resumos_exames"])
+        if not usuario.exists or "resumos_exames" not in (usuario.to_dict() or {}):
+            return True
+        
+        dados = {f"resumos_exames.{pet_id}.exames.{exame_id}": _resumo_exame(exame_data, data_upload)}
+        
+        # Pet ainda fora do resumo (cadastrado depois dele): grava também nome e ordem,
+        # senão o cabeçalho do pet sairia vazio. obter_pets lista os mais recentes primeiro,
+        # então ele vai para o topo até atualizar_resumo_pets renumerar todos
+        if "nome" not in usuario.to_dict()["resumos_exames"].get(pet_id, {}):
+            pet = usuario_ref.collection("pets").document(pet_id).get(field_paths=["nome"])
+            dados[f"resumos_exames.{pet_id}.nome"] = (pet.to_dict() or {}).get("nome", "")
+            dados[f"resumos_exames.{pet_id}.ordem"] = -1
+        
+        usuario_ref.update(dados)
+        return True
+    except Exception as e:
+        print(f"Erro ao atualizar o resumo do exame {exame_id}: {e}")
+        return False
 
-    for pet in pets:
-        # O try deve englobar toda a operação que depende do banco de dados
-        try:
-            exames_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("pets").document(pet['id']).collection("exames")
-            
-            docs = exames_ref.order_by("data_upload", direction=firestore.Query.DESCENDING).get()
-            resumos = []
-            
-            for doc in docs:
-                exame_data = doc.to_dict()
-                exame_dict = {
-                    "tipo_exame": exame_data.get("tipo_exame", "Não informado"),
-                    "data_exame": exame_data.get("data_exame", "Não informada"),
-                    # SUGESTÃO 2: Adicionar valores padrão para evitar o "None" no texto.
-                    "resultado_exame": exame_data.get("resultado_exame", "Não informado"),
-                    "mini_relatorio": exame_data.get("mini_relatorio", "Nenhum resumo disponível.")
-                }
-                resumos.append(exame_dict)
-
-            # CORREÇÃO PRINCIPAL: Este bloco foi movido para DENTRO do 'try'.
-            texto += f"Resumo dos exames de {pet['nome']}:\n"
-
-            if resumos:
-                for exame in resumos:
-                    # Usar f-string com aspas triplas para múltiplas linhas é uma ótima ideia!
-                    texto += f"""  - Tipo do exame: {exame['tipo_exame']}
+def _reconstruir_resumos_exames():
+    """
+    Monta o campo `resumos_exames` a partir das coleções de exames (uma consulta por pet).
+    Usada apenas uma vez, para usuários cujo documento ainda não possui o resumo.
+    
+    Returns:
+        dict: Mapa {pet_id: {"nome", "ordem", "exames": {exame_id: resumo}}}
+    """
+    db = obter_db()
+    resumos = {}
+    
+    for ordem, pet in enumerate(obter_pets()):
+        exames_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("pets").document(pet['id']).collection("exames")
+        resumos[pet['id']] = {
+            "nome": pet.get('nome', ''),
+            "ordem": ordem,
+            "exames": {doc.id: _resumo_exame(doc.to_dict()) for doc in exames_ref.get()}
+        }
+    
+    db.collection(COLECAO_USUARIOS).document(st.user.email).update({"resumos_exames": resumos})
+    invalidar_cache(("usuario",))
+    return resumos
+
+def _formatar_resumos_exames(resumos):
+    """
+    Formata o mapa de resumos de exames em uma única string de contexto.
+    
+    Args:
+        resumos: Mapa {pet_id: {"nome", "ordem", "exames"}} guardado no documento do usuário
+        
+    Returns:
+        str: Uma string formatada com os dados dos exames de todos os pets.
+    """
+    texto = ""
+    
+    for pet in sorted(resumos.values(), key=lambda p: p.get("ordem", 0)):
+        nome = pet.get("nome", "")
+        texto += f"Resumo dos exames de {nome}:\n"
+        
+        exames = sorted((pet.get("exames") or {}).values(), key=lambda e: e.get("data_upload") or DATA_MINIMA_UTC, reverse=True)
+        if exames:
+            for exame in exames:
+                texto += f"""  - Tipo do exame: {exame['tipo_exame']}
   - Data do exame: {exame['data_exame']}
   - Resultado/Indicativo: {exame['resultado_exame']}
-  - Relatório breve: {exame['mini_relatorio']}\n---\n""" # Adicionei uma quebra de linha extra para separar melhor os exames
-            else:
-                texto += f"  Nenhum exame encontrado para {pet['nome']}\n\n"
-    
-        except Exception as e:
-            print(f"Erro ao obter os resumos de exames do pet {pet.get('nome', 'ID desconhecido')}: {e}")
-            texto += f"  Não foi possível obter os exames de {pet.get('nome', 'ID desconhecido')}.\n\n"
+  - Relatório breve: {exame['mini_relatorio']}\n---\n"""
+        else:
+            texto += f"  Nenhum exame encontrado para {nome}\n\n"
     
     return texto
 
+def obter_info_exames():
+    """
+    Obtém todos os resumos, feitos pelo agente de IA, dos exames dos pets do usuário
+    e formata tudo em uma única string de contexto.
+    
+    Os resumos ficam guardados no campo `resumos_exames` do documento do usuário,
+    então a leitura custa um único documento (normalmente já em cache pelo login).
+    
+    Returns:
+        str: Uma string formatada com os dados dos exames de todos os pets.
+    """
+    if not hasattr(st.user, 'email'):
+        return ""
+    
+    try:
+        dados_usuario = _obter_documento_usuario() or {}
+        resumos = dados_usuario.get("resumos_exames")
+        if resumos is None:
+            resumos = _reconstruir_resumos_exames()
+        return _formatar_resumos_exames(resumos)
+    except Exception as e:
+        print(f"Erro ao obter os resumos de exames: {e}")
+        return "  Não foi possível obter os exames dos pets.\n\n"
+
 def salvar_acontecimento_pet(pet_id, data_hora, descricao, url_foto=None):
     """
     Salva um acontecimento do pet no Firestore.
@@ -2081,7 +3030,7 @@ def salvar_acontecimento_pet(pet_id, data_hora, descricao, url_foto=None):
     if not hasattr(st.user, 'email'):
         return None
         
-    db = firestore.client()
+    db = obter_db()
     acontecimentos_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("pets").document(pet_id).collection("acontecimentos")
     
     try:
@@ -2095,11 +3044,41 @@ def salvar_acontecimento_pet(pet_id, data_hora, descricao, url_foto=None):
         
         print(f"Salvando acontecimento com dados: {dados_acontecimento}")
         doc_ref = acontecimentos_ref.add(dados_acontecimento)
+        invalidar_cache(("acontecimentos", pet_id))
         return doc_ref[1].id  # Retorna o ID do documento criado
     except Exception as e:
         print(f"Erro ao salvar acontecimento: {e}")
         return None
 
+def _consultar_acontecimentos_pet(db, email, pet_id):
+    """
+    Consulta os acontecimentos de um pet no Firestore, do mais recente para o mais antigo.
+    Não depende de st.user, podendo ser executada fora da thread do script.
+    
+    Args:
+        db: Cliente do Firestore
+        email: Email do usuário dono do pet
+        pet_id: ID do pet
+        
+    Returns:
+        list: Lista de dicionários com dados dos acontecimentos
+    """
+    acontecimentos_ref = db.collection(COLECAO_USUARIOS).document(email).collection("pets").document(pet_id).collection("acontecimentos")
+    docs = acontecimentos_ref.order_by("data_hora", direction=firestore.Query.DESCENDING).get()
+    
+    acontecimentos = []
+    for doc in docs:
+        acontecimento_data = doc.to_dict()
+        acontecimentos.append({
+            "id": doc.id,
+            "data_hora": acontecimento_data.get("data_hora"),
+            "descricao": acontecimento_data.get("descricao", "Acontecimento sem descrição"),
+            "url_foto": acontecimento_data.get("url_foto", ""),
+            "timestamp": acontecimento_data.get("timestamp"),
+            "data_atualizacao": acontecimento_data.get("data_atualizacao")
+        })
+    return acontecimentos
+
 def obter_acontecimentos_pet(pet_id):
     """
     Obtém a lista de acontecimentos de um pet específico.
@@ -2112,31 +3091,120 @@ def obter_acontecimentos_pet(pet_id):
     """
     if not hasattr(st.user, 'email'):
         return []
+    
+    acontecimentos = _cache_ler(("acontecimentos", pet_id))
+    if acontecimentos is not None:
+        return acontecimentos
         
-    db = firestore.client()
-    acontecimentos_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("pets").document(pet_id).collection("acontecimentos")
+    db = obter_db()
     
     try:
-        docs = acontecimentos_ref.order_by("data_hora", direction=firestore.Query.DESCENDING).get()
-        acontecimentos = []
-        
-        for doc in docs:
-            acontecimento_data = doc.to_dict()
-            acontecimento_dict = {
-                "id": doc.id,
-                "data_hora": acontecimento_data.get("data_hora"),
-                "descricao": acontecimento_data.get("descricao", "Acontecimento sem descrição"),
-                "url_foto": acontecimento_data.get("url_foto", ""),
-                "timestamp": acontecimento_data.get("timestamp"),
-                "data_atualizacao": acontecimento_data.get("data_atualizacao")
-            }
-            acontecimentos.append(acontecimento_dict)
-            
+        acontecimentos = _consultar_acontecimentos_pet(db, st.user.email, pet_id)
+        _cache_gravar(("acontecimentos", pet_id), acontecimentos)
         return acontecimentos
     except Exception as e:
         print(f"Erro ao obter acontecimentos do pet {pet_id}: {e}")
         return []
 
+def recuperar_analises_interrompidas(pets):
+    """
+    Marca como "erro" as análises de exames paradas numa etapa intermediária há mais de
+    ANALISE_EXAME_TEMPO_LIMITE_SEGUNDOS. A fila de análises fica só na memória do processo,
+    então um reinício do servidor deixaria esses exames "em análise" para sempre; com o
+    status "erro" o card do pet oferece analisar o exame novamente.
+    
+    Args:
+        pets: Lista de pets com 'exames' (ex: carregar_painel_pets); os exames
+              interrompidos também são atualizados nesta lista
+    """
+    if not hasattr(st.user, 'email'):
+        return
+    
+    limite = datetime.now(timezone.utc) - timedelta(seconds=ANALISE_EXAME_TEMPO_LIMITE_SEGUNDOS)
+    interrompidos = []
+    for pet in pets:
+        for exame in pet.get('exames') or []:
+            if exame.get('status') in (None, "concluido", "erro"):
+                continue
+            atualizado_em = exame.get('status_atualizado_em') or exame.get('data_upload')
+            # Datas sem fuso horário são tratadas como horário local
+            if atualizado_em is not None and atualizado_em.astimezone(timezone.utc) > limite:
+                continue
+            interrompidos.append((pet['id'], exame))
+    
+    if not interrompidos:
+        return
+    
+    try:
+        db = obter_db()
+        pets_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("pets")
+        batch = db.batch()
+        for pet_id, exame in interrompidos:
+            batch.update(pets_ref.document(pet_id).collection("exames").document(exame['id']), {
+                "status": "erro",
+                "erro_analise": "Análise interrompida antes de terminar",
+                "status_atualizado_em": datetime.now()
+            })
+        batch.commit()
+    except Exception as e:
+        print(f"Erro ao marcar análises de exames interrompidas: {e}")
+        return
+    
+    for pet_id, exame in interrompidos:
+        print(f"Análise do exame {exame['id']} interrompida na etapa '{exame['status']}'")
+        exame['status'] = "erro"
+        invalidar_cache(("exames", pet_id))
+
+def carregar_painel_pets():
+    """
+    Carrega de uma só vez os pets do usuário junto com seus exames e acontecimentos.
+    
+    As consultas de exames e acontecimentos de todos os pets são feitas em paralelo,
+    substituindo as várias leituras sequenciais que cada card do painel fazia.
+    
+    Returns:
+        list: Lista de pets (mesmo formato de obter_pets) com as chaves adicionais
+              'exames' e 'acontecimentos'
+    """
+    if not hasattr(st.user, 'email'):
+        return []
+    
+    pets = obter_pets()
+    if not pets:
+        return []
+    
+    db = obter_db()
+    email = st.user.email
+    
+    # Só consulta o Firestore para o que não estiver no cache da sessão
+    resultados = {}
+    consultas = {}
+    with ThreadPoolExecutor(max_workers=MAX_CONSULTAS_SIMULTANEAS) as executor:
+        for pet in pets:
+            for tipo, consultar in (("exames", _consultar_exames_pet), ("acontecimentos", _consultar_acontecimentos_pet)):
+                chave = (tipo, pet['id'])
+                em_cache = _cache_ler(chave)
+                if em_cache is not None:
+                    resultados[chave] = em_cache
+                else:
+                    consultas[chave] = executor.submit(consultar, db, email, pet['id'])
+    
+    for chave, consulta in consultas.items():
+        try:
+            resultados[chave] = consulta.result()
+            _cache_gravar(chave, resultados[chave])
+        except Exception as e:
+            print(f"Erro ao obter {chave[0]} do pet {chave[1]}: {e}")
+            resultados[chave] = []
+    
+    painel = []
+    for pet in pets:
+        exames = resultados[("exames", pet['id'])]
+        acontecimentos = resultados[("acontecimentos", pet['id'])]
+        painel.append({**pet, "exames": exames, "acontecimentos": acontecimentos})
+    
+    return painel
+
 def fazer_upload_foto_acontecimento(foto, pet_id, acontecimento_id):
     """
     Faz upload de uma foto de acontecimento para o Firebase Storage.
@@ -2153,19 +3221,19 @@ def fazer_upload_foto_acontecimento(foto, pet_id, acontecimento_id):
         return None
         
     try:
-        bucket = storage.bucket()
+        bucket = obter_bucket()
         
-        # Define o nome do arquivo
-        nome_arquivo = f"usuarios/{st.user.email}/pets/{pet_id}/acontecimentos/{acontecimento_id}_{foto.name}"
+        # Reduz e recodifica a foto (orientação aplicada, sem EXIF)
+        img = ImageOps.exif_transpose(Image.open(foto))
+        img.thumbnail((LADO_MAXIMO_FOTO_ACONTECIMENTO, LADO_MAXIMO_FOTO_ACONTECIMENTO), Image.Resampling.LANCZOS)
+        conteudo, extensao, content_type = codificar_imagem(img, ORCAMENTO_BYTES_FOTO_ACONTECIMENTO)
         
-        # Faz upload do arquivo
-        blob = bucket.blob(nome_arquivo)
-        blob.upload_from_file(foto, content_type=foto.type)
-        
-        # Torna público
-        blob.make_public()
+        # Define o nome do arquivo (único, para que a URL nunca aponte para outro conteúdo)
+        nome_foto = os.path.splitext(foto.name)[0]
+        nome_arquivo = f"usuarios/{st.user.email}/pets/{pet_id}/acontecimentos/{acontecimento_id}_{uuid.uuid4().hex}_{nome_foto}.{extensao}"
         
-        return blob.public_url
+        # Faz upload do arquivo, torna público e guarda no cache local
+        return _enviar_imagem_storage(bucket, nome_arquivo, conteudo, content_type)
         
     except Exception as e:
         print(f"Erro ao fazer upload da foto do acontecimento: {e}")
@@ -2188,7 +3256,7 @@ def editar_acontecimento_pet(acontecimento_id, pet_id, data_hora, descricao, url
     if not hasattr(st.user, 'email'):
         return False
         
-    db = firestore.client()
+    db = obter_db()
     acontecimento_ref = db.collection(COLECAO_USUARIOS).document(st.user.email).collection("pets").document(pet_id).collection("acontecimentos").document(acontecimento_id)
     
     try:
@@ -2200,6 +3268,7 @@ def editar_acontecimento_pet(acontecimento_id, pet_id, data_hora, descricao, url
         }
         
         acontecimento_ref.update(dados_atualizados)
+        invalidar_cache(("acontecimentos", pet_id))
         return True
     except Exception as e:
         print(f"Erro ao editar acontecimento: {e}")
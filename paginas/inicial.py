@@ -1,20 +1,24 @@
 import streamlit as st
 from datetime import date, datetime
 from paginas.funcoes import (
-    obter_pets, 
+    carregar_painel_pets, 
     excluir_pet, 
     registrar_acao_usuario,
-    gerar_relatorio_pet_html,
+    enviar_relatorio_pet,
+    enviar_exportacao_pets,
+    obter_status_relatorio,
+    nome_arquivo_seguro,
     fazer_upload_exame_pet,
     salvar_exame_pet,
-    obter_exames_pet,
     salvar_acontecimento_pet,
-    obter_acontecimentos_pet,
     fazer_upload_foto_acontecimento,
-    editar_acontecimento_pet
+    editar_acontecimento_pet,
+    url_foto_pet,
+    invalidar_cache,
+    recuperar_analises_interrompidas
 )
 from paginas.agentes_funcoes import (
-    relator
+    enviar_exame_para_analise
 )
 
 
@@ -97,29 +101,86 @@ def dialog_adicionar_exame(pet_id, pet_nome):
                             exame_id = salvar_exame_pet(pet_id, nome_exame, url_pdf)
                             
                             if exame_id:
-                                st.success(f"✅ Exame '{nome_exame}' adicionado com sucesso!", width="stretch")
                                 registrar_acao_usuario("Adicionar Exame", f"Usuário adicionou exame '{nome_exame}' para o pet {pet_nome}")
                                 
-                                # Encaminha as informações gerais do exame, tratadas pela IA, para o banco de dados
-                                resultado = relator(pet_id = pet_id, exame_doc_id = exame_id, pdf = arquivo_pdf)
-                                st.success(f"✅ Ótimo! Nosso assistente digital já estudou o exame de {pet_nome} e está pronto para conversar sobre os resultados.",
-                                    width="stretch")
+                                # A análise do exame pela IA segue em segundo plano; o andamento aparece no card do pet
+                                iniciar_analise_exame(pet_id, exame_id, nome_exame, pdf_bytes=arquivo_pdf.getvalue())
+                                st.toast(f"✅ Exame '{nome_exame}' adicionado com sucesso!")
+                                st.rerun()
                             else:
                                 st.error("❌ Erro ao salvar exame no banco de dados.")
                         else:
                             st.error("❌ Erro ao fazer upload do arquivo. Tente novamente.")
-                    st.balloons()
-
-                    # Pausa antes de fechar o diálogo
-                    import time
-                    time.sleep(5)
-                    st.rerun()
                     
-        
         with col2:
             if st.form_submit_button("❌ Cancelar", use_container_width=True):
                 st.rerun()
 
+# ============================================================================
+# ANDAMENTO DA ANÁLISE DOS EXAMES EM SEGUNDO PLANO
+# ============================================================================
+
+# Exames enviados nesta sessão cuja análise pelo relator ainda não foi exibida:
+# {exame_id: {"pet_id", "nome_exame", "etapa", "futuro"[, "resultado"]}}
+if "exames_em_analise" not in st.session_state:
+    st.session_state.exames_em_analise = {}
+
+ETAPAS_ANALISE_EXAME = {
+    "enviado": (0.1, "Aguardando o assistente..."),
+    "extraindo": (0.3, "Lendo o PDF do exame..."),
+    "analisando": (0.6, "O assistente está estudando o exame..."),
+    "salvando": (0.9, "Salvando as informações do exame...")
+}
+
+def iniciar_analise_exame(pet_id, exame_id, nome_exame, pdf_bytes=None, url_pdf=None):
+    """Envia o exame ao relator em segundo plano e passa a acompanhar a análise nesta sessão."""
+    analise = {"pet_id": pet_id, "nome_exame": nome_exame, "etapa": "enviado"}
+    analise["futuro"] = enviar_exame_para_analise(
+        pet_id,
+        exame_id,
+        pdf_bytes=pdf_bytes,
+        url_pdf=url_pdf,
+        ao_progredir=lambda etapa: analise.update(etapa=etapa)
+    )
+    st.session_state.exames_em_analise[exame_id] = analise
+
+def _resultado_analise(futuro):
+    """Retorno do relator, ou a mensagem da exceção que interrompeu a análise."""
+    erro = futuro.exception()
+    return f"Erro inesperado na análise: {erro}" if erro else futuro.result()
+
+@st.fragment(run_every=1)
+def acompanhar_analise_exames(pet_id):
+    """Atualiza apenas as barras de progresso; recarrega a página quando uma análise termina."""
+    analises = [analise for analise in st.session_state.exames_em_analise.values() if analise["pet_id"] == pet_id]
+    if any(analise["futuro"].done() for analise in analises):
+        st.rerun()
+    
+    for analise in analises:
+        progresso, texto = ETAPAS_ANALISE_EXAME.get(analise["etapa"], ETAPAS_ANALISE_EXAME["salvando"])
+        st.progress(progresso, text=f"{analise['nome_exame']}: {texto}")
+
+def exibir_analise_exames(pet):
+    """Mostra o andamento das análises de exames do pet e o resultado das que terminaram."""
+    analises = {
+        exame_id: analise
+        for exame_id, analise in st.session_state.exames_em_analise.items()
+        if analise["pet_id"] == pet['id']
+    }
+    
+    # Resultados já recarregados no painel são exibidos uma única vez
+    for exame_id, analise in analises.items():
+        if "resultado" not in analise:
+            continue
+        if analise["resultado"] is True:
+            st.success(f"✅ Ótimo! Nosso assistente digital já estudou o exame '{analise['nome_exame']}' de {pet['nome']} e está pronto para conversar sobre os resultados.")
+        else:
+            st.warning(f"⚠️ Não foi possível analisar o exame '{analise['nome_exame']}': {analise['resultado']}")
+        del st.session_state.exames_em_analise[exame_id]
+    
+    if any("resultado" not in analise for analise in analises.values()):
+        acompanhar_analise_exames(pet['id'])
+
 # ============================================================================
 # DIÁLOGO PARA REGISTRAR ACONTECIMENTO
 # ============================================================================
@@ -213,7 +274,7 @@ def dialog_registrar_acontecimento(pet_id, pet_nome):
 def dialog_motivo_consulta(pet, formato="html"):
     st.markdown(f"### Adicione o principal motivo da consulta para {pet['nome']}")
     
-    st.info("📋 Gerando relatório veterinário para download")
+    st.info("📋 O relatório será gerado em segundo plano e ficará disponível para download no card do pet")
 
     with st.form("motivo_da_consulta"):
         motivo = st.text_area(
@@ -229,33 +290,129 @@ def dialog_motivo_consulta(pet, formato="html"):
             type="primary"
         )
         
-        condicao = False
-        html_content = None
-
         if submitted:
             # Validação para garantir que o campo não está vazio
             if not motivo:
                 st.error("Por favor, preencha o motivo da consulta antes de gerar o relatório.")
             else:
-                with st.spinner("Gerando o relatório, por favor aguarde..."):
-                    html_content = gerar_relatorio_pet_html(pet, motivo_consulta=motivo)
-                    st.success("✅ Relatório gerado com sucesso! Clique abaixo para baixar.")
-                    condicao = True
+                # O relatório é gerado em segundo plano; o andamento aparece no card do pet
+                tarefa_id = enviar_relatorio_pet(
+                    pet,
+                    motivo_consulta=motivo,
+                    formato=formato,
+                    exames=pet.get('exames'),
+                    acontecimentos=pet.get('acontecimentos')
+                )
+                if tarefa_id:
+                    st.session_state.relatorios_tarefas[pet['id']] = {"id": tarefa_id, "formato": formato}
+                    st.rerun()
+                else:
+                    st.error("Não foi possível iniciar a geração do relatório. Tente novamente.")
+
+# ============================================================================
+# ANDAMENTO E DOWNLOAD DOS RELATÓRIOS GERADOS EM SEGUNDO PLANO
+# ============================================================================
+
+# Relatórios enviados nesta sessão, por pet: {pet_id: {"id": tarefa_id, "formato": "html"|"pdf"}}
+if "relatorios_tarefas" not in st.session_state:
+    st.session_state.relatorios_tarefas = {}
+
+ETAPAS_RELATORIO = {
+    "fila": (0.05, "Aguardando na fila..."),
+    "download": (0.25, "Baixando fotos e exames..."),
+    "renderizacao": (0.55, "Montando o relatório..."),
+    "juncao": (0.8, "Anexando os exames...")
+}
+
+@st.fragment(run_every=1)
+def acompanhar_relatorio(tarefa_id):
+    """Atualiza apenas a barra de progresso; recarrega a página quando o relatório termina."""
+    status = obter_status_relatorio(tarefa_id)
+    if status is None or status["etapa"] not in ETAPAS_RELATORIO:
+        st.rerun()
+    
+    if "total" in status:
+        # Exportação de vários pets: progresso pela quantidade de relatórios prontos
+        progresso = status["concluidos"] / max(status["total"], 1)
+        texto = f"Gerando relatórios ({status['concluidos']}/{status['total']})..."
+    else:
+        progresso, texto = ETAPAS_RELATORIO[status["etapa"]]
+    st.progress(progresso, text=texto)
+
+def exibir_relatorio_pet(pet):
+    """Mostra o andamento do relatório do pet ou o botão para baixá-lo, se já estiver pronto."""
+    tarefa = st.session_state.relatorios_tarefas.get(pet['id'])
+    if tarefa is None:
+        return
+    
+    status = obter_status_relatorio(tarefa["id"])
+    if status is None:
+        # Relatório expirou e foi removido
+        del st.session_state.relatorios_tarefas[pet['id']]
+        return
     
-    if condicao:
-        # Botão para download do relatório
+    if status["etapa"] == "concluido":
+        # st.download_button guarda o arquivo inteiro na memória do servidor (MediaFileManager);
+        # só a geração e a junção dos PDFs ficam limitadas pelo disco
+        with open(status["arquivo"], "rb") as arquivo:
+            relatorio = arquivo.read()
         st.download_button(
             label="💾 Baixar relatório",
-            data=html_content,
-            file_name=f"relatorio_{pet['nome']}.html",
-            mime="text/html",
+            data=relatorio,
+            file_name=f"relatorio_{nome_arquivo_seguro(pet['nome'])}.{tarefa['formato']}",
+            mime="application/pdf" if tarefa['formato'] == "pdf" else "text/html",
+            key=f"baixar_relatorio_{pet['id']}",
             use_container_width=True,
             type="primary"
         )
-
-
-
-        
+    elif status["etapa"] == "erro":
+        st.error("Não foi possível gerar o relatório. Tente novamente.")
+        if st.button("Fechar", key=f"fechar_relatorio_{pet['id']}", type="tertiary"):
+            del st.session_state.relatorios_tarefas[pet['id']]
+            st.rerun()
+    else:
+        acompanhar_relatorio(tarefa["id"])
+
+def exibir_exportacao_pets(pets):
+    """Botão para exportar os relatórios de todos os pets em um ZIP, com andamento e download."""
+    tarefa_id = st.session_state.get("exportacao_pets")
+    status = obter_status_relatorio(tarefa_id) if tarefa_id else None
+    
+    if status is None or status["etapa"] == "erro":
+        if status is not None:
+            st.error("Não foi possível exportar os relatórios. Tente novamente.")
+        if st.button(
+            "📦 Exportar relatórios de todos os pets",
+            key="exportar_todos_pets",
+            help="Gera o relatório de cada pet (com os exames anexados, quando houver) em um único arquivo ZIP",
+            type="secondary"
+        ):
+            tarefa_id = enviar_exportacao_pets(pets)
+            if tarefa_id:
+                st.session_state.exportacao_pets = tarefa_id
+                registrar_acao_usuario("Exportar Relatórios", f"Usuário exportou os relatórios de {len(pets)} pet(s)")
+                st.rerun()
+            else:
+                st.error("Não foi possível iniciar a exportação. Tente novamente.")
+    elif status["etapa"] == "concluido":
+        col_baixar, col_fechar = st.columns([4, 1])
+        with col_baixar:
+            with open(status["arquivo"], "rb") as arquivo:
+                exportacao = arquivo.read()
+            st.download_button(
+                label="💾 Baixar relatórios de todos os pets (ZIP)",
+                data=exportacao,
+                file_name="relatorios_pets.zip",
+                mime="application/zip",
+                key="baixar_exportacao_pets",
+                type="primary"
+            )
+        with col_fechar:
+            if st.button("Fechar", key="fechar_exportacao_pets", type="tertiary"):
+                del st.session_state.exportacao_pets
+                st.rerun()
+    else:
+        acompanhar_relatorio(tarefa_id)
 
 # ============================================================================
 # WELCOME MESSAGE
@@ -271,11 +428,25 @@ else:
 # LISTAGEM DOS PETS CADASTRADOS
 # ============================================================================
 
-pets = obter_pets()
+# Análises de exames que terminaram desde a última execução: os exames do pet e o
+# resumo do usuário foram gravados em segundo plano e precisam ser relidos
+for analise in st.session_state.exames_em_analise.values():
+    if analise["futuro"].done() and "resultado" not in analise:
+        analise["resultado"] = _resultado_analise(analise["futuro"])
+        invalidar_cache(("exames", analise["pet_id"]), ("usuario",))
+
+# Pets, exames e acontecimentos carregados de uma só vez para todo o painel
+pets = carregar_painel_pets()
+
+# Análises perdidas (ex: servidor reiniciado no meio delas) passam a "erro" e podem ser refeitas
+recuperar_analises_interrompidas(pets)
 
 if len(pets) > 0: 
     st.subheader(f"🐾 Seus Pets ({len(pets)})")
     
+    # Exportação dos relatórios de todos os pets de uma vez
+    exibir_exportacao_pets(pets)
+    
     # Organiza pets em grupos de 3 para as colunas
     for i in range(0, len(pets), 3):
         cols = st.columns(3)
@@ -287,7 +458,7 @@ if len(pets) > 0:
                 with st.container(border=True):
                     # Foto do pet centralizada
                     if pet["url_foto"]:
-                        st.image(pet["url_foto"], use_container_width=True)
+                        st.image(url_foto_pet(pet, "card"), use_container_width=True)
                     else:
                         st.markdown("🐾", help="Sem foto")
                     
@@ -299,8 +470,8 @@ if len(pets) > 0:
                     st.markdown(f"**{pet['sexo']}** • **{pet['idade']}**")
                     
                     # Contador de exames e acontecimentos
-                    exames_count = len(obter_exames_pet(pet['id']))
-                    acontecimentos_count = len(obter_acontecimentos_pet(pet['id']))
+                    exames_count = len(pet['exames'])
+                    acontecimentos_count = len(pet['acontecimentos'])
                     
                     if exames_count > 0:
                         st.markdown(f"📋 **{exames_count}** exame(s) cadastrado(s)")
@@ -358,7 +529,7 @@ if len(pets) > 0:
                             st.write(pet['alimentacao'])
                         
                         # Seção de exames
-                        exames = obter_exames_pet(pet['id'])
+                        exames = pet['exames']
                         if exames:
                             st.markdown("---")
                             st.markdown(f"**📋 Exames ({len(exames)}):**")
@@ -403,6 +574,17 @@ if len(pets) > 0:
                                 
                                 st.markdown(f"   🏷️ **Tipo:** {tipo_exame}")
                                 
+                                # Exames enviados antes da análise em segundo plano não têm status
+                                em_analise = exame['id'] in st.session_state.exames_em_analise
+                                if exame.get('status') == "erro" and not em_analise:
+                                    st.markdown("   ⚠️ O assistente não conseguiu analisar este exame")
+                                    if exame['url_pdf'] and st.button("🔁 Analisar novamente", key=f"reanalisar_exame_{exame['id']}", type="tertiary"):
+                                        iniciar_analise_exame(pet['id'], exame['id'], exame['nome_exame'], url_pdf=exame['url_pdf'])
+                                        registrar_acao_usuario("Reanalisar Exame", f"Usuário pediu nova análise do exame '{exame['nome_exame']}' do pet {pet['nome']}")
+                                        st.rerun()
+                                elif em_analise or exame.get('status') not in (None, "concluido"):
+                                    st.markdown("   ⏳ Em análise pelo assistente")
+                                
                                 if exame['url_pdf']:
                                     st.markdown(f"   [📄 Baixar PDF do Exame]({exame['url_pdf']})")
                                 
@@ -414,7 +596,7 @@ if len(pets) > 0:
                         
                     
                     # Expander específico para acontecimentos
-                    acontecimentos = obter_acontecimentos_pet(pet['id'])
+                    acontecimentos = pet['acontecimentos']
                     with st.expander(f"📝 Acontecimentos ({len(acontecimentos)})", expanded=False):
                         if acontecimentos:
                             for idx, acontecimento in enumerate(acontecimentos, 1):
@@ -455,8 +637,7 @@ if len(pets) > 0:
                     
                     with col_btn1:
                         # Botão de gerar relatório
-                        exames_pet = obter_exames_pet(pet['id'])
-                        num_exames = len(exames_pet)
+                        num_exames = len(pet['exames'])
                         
                         if num_exames > 0:
                             help_text = f"Baixar relatório completo + {num_exames} exame(s) listado(s)"
@@ -492,6 +673,12 @@ if len(pets) > 0:
                         ):
                             dialog_registrar_acontecimento(pet['id'], pet['nome'])
                     
+                    # Exames em análise pelo assistente
+                    exibir_analise_exames(pet)
+                    
+                    # Relatório em geração ou pronto para download
+                    exibir_relatorio_pet(pet)
+                    
 
 else:
     # Mensagem quando não há pets cadastrados
@@ -1,15 +1,64 @@
 import streamlit as st
-from openai import OpenAI
+import httpx
+from openai import OpenAI, DefaultHttpxClient
 
 # Modelo padrão para as funções auxiliares (pode ser ajustado ou passado como argumento)
 MODELO_PADRAO = 'gpt-4o-mini'
 
+# Parâmetros de conexão do cliente OpenAI compartilhado.
+# Podem ser sobrescritos na seção [openai] do secrets.toml (ex: timeout_segundos = 30)
+OPENAI_TIMEOUT_SEGUNDOS = 60.0
+OPENAI_TIMEOUT_CONEXAO_SEGUNDOS = 10.0
+OPENAI_MAX_CONEXOES = 20
+OPENAI_MAX_CONEXOES_OCIOSAS = 10
+OPENAI_KEEPALIVE_SEGUNDOS = 120.0
+OPENAI_MAX_TENTATIVAS = 2
+
+def _config_openai(chave, padrao):
+    """Lê um parâmetro opcional da seção [openai] do secrets.toml, com valor padrão."""
+    try:
+        return type(padrao)(st.secrets.get("openai", {}).get(chave, padrao))
+    except Exception:
+        return padrao
+
+@st.cache_resource(show_spinner=False)
+def obter_cliente_openai():
+    """
+    Retorna o cliente OpenAI compartilhado pelo processo.
+    
+    O cliente é criado uma única vez, com um pool de conexões keep-alive, para que
+    chamadas repetidas não paguem de novo o handshake TLS e a abertura de conexão.
+    
+    Returns:
+        OpenAI: Cliente OpenAI configurado
+        
+    Raises:
+        KeyError: Se a chave 'OPENAI_API_KEY' não estiver no secrets.toml
+    """
+    timeout = httpx.Timeout(
+        _config_openai("timeout_segundos", OPENAI_TIMEOUT_SEGUNDOS),
+        connect=_config_openai("timeout_conexao_segundos", OPENAI_TIMEOUT_CONEXAO_SEGUNDOS)
+    )
+    http_client = DefaultHttpxClient(
+        timeout=timeout,
+        limits=httpx.Limits(
+            max_connections=_config_openai("max_conexoes", OPENAI_MAX_CONEXOES),
+            max_keepalive_connections=_config_openai("max_conexoes_ociosas", OPENAI_MAX_CONEXOES_OCIOSAS),
+            keepalive_expiry=_config_openai("keepalive_segundos", OPENAI_KEEPALIVE_SEGUNDOS)
+        )
+    )
+    return OpenAI(
+        api_key=st.secrets["OPENAI_API_KEY"],
+        http_client=http_client,
+        timeout=timeout,
+        max_retries=_config_openai("max_tentativas", OPENAI_MAX_TENTATIVAS)
+    )
+
 # Helper para obter cliente OpenAI (evita repetição e centraliza erro de chave)
 def _get_openai_client():
-    """Retorna um cliente OpenAI inicializado ou None se a chave não for encontrada."""
+    """Retorna o cliente OpenAI compartilhado ou None se a chave não for encontrada."""
     try:
-        api_key = st.secrets["OPENAI_API_KEY"]
-        return OpenAI(api_key=api_key)
+        return obter_cliente_openai()
     except KeyError:
         st.error("Erro de configuração: Chave secreta 'OPENAI_API_KEY' não encontrada.")
         return None
@@ -17,6 +66,32 @@ def _get_openai_client():
         st.error(f"Erro ao inicializar cliente OpenAI: {e}")
         return None
 
+def medir_cache_prompt(uso, origem):
+    """
+    Resume o uso de tokens de uma chamada ao modelo e registra no log a proporção
+    dos tokens do prompt atendidos pelo cache de prefixo do provedor.
+    
+    Args:
+        uso: Objeto `usage` da resposta (em streaming, vem no último chunk
+            quando a chamada usa stream_options={"include_usage": True})
+        origem: Nome da chamada, usado no log
+        
+    Returns:
+        dict: tokens_prompt, tokens_cache e proporcao_cache (vazio se não houver uso)
+    """
+    if uso is None:
+        return {}
+    
+    detalhes = getattr(uso, "prompt_tokens_details", None)
+    tokens_cache = getattr(detalhes, "cached_tokens", None) or 0
+    proporcao = tokens_cache / uso.prompt_tokens if uso.prompt_tokens else 0.0
+    print(f"[{origem}] tokens do prompt: {uso.prompt_tokens} | em cache: {tokens_cache} ({proporcao:.0%})")
+    return {
+        "tokens_prompt": uso.prompt_tokens,
+        "tokens_cache": tokens_cache,
+        "proporcao_cache": round(proporcao, 3)
+    }
+
 def gerar_titulo_chat(mensagens):
     """
     Gera um título profissional e objetivo para um chat baseado nas mensagens.
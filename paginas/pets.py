@@ -6,7 +6,8 @@ from paginas.funcoes import (
     excluir_pet,
     registrar_acao_usuario,
     calcular_idade,
-    atualizar_resumo_pets
+    atualizar_resumo_pets,
+    url_foto_pet
 )
 from datetime import date
 
@@ -477,7 +478,7 @@ for i in range(0, len(pets_com_botao), 3):
                     gradient = degrades[pet_index % len(degrades)]
                     
                     # HTML do card do pet com novo layout
-                    foto_url = pet.get('url_foto', 'https://via.placeholder.com/200x200?text=🐾')
+                    foto_url = url_foto_pet(pet, "card") or 'https://via.placeholder.com/200x200?text=🐾'
                     
                     st.markdown(f"""
                     <div class="pet-card" style="background: {gradient};">
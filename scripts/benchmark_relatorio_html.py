@@ -0,0 +1,101 @@
+"""
+Mede o tempo de geração do relatório HTML para pets com 0, 10 e 100
+exames/acontecimentos, usando dados fictícios (sem Firebase): a versão anterior,
+em um único f-string, e a atual, com templates pré-compilados (gerar_relatorio_pet_html).
+
+A versão anterior é lida do histórico do git (paginas/funcoes.py em REVISAO_ANTERIOR)
+e carregada como módulo temporário, então o benchmark precisa rodar dentro do repositório.
+
+Uso, a partir da raiz do projeto:
+    python scripts/benchmark_relatorio_html.py [repeticoes]
+"""
+import os
+import subprocess
+import sys
+import timeit
+import types
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from paginas.funcoes import gerar_relatorio_pet_html
+
+# Última revisão com o relatório HTML em f-string (pai do commit que introduziu os templates)
+REVISAO_ANTERIOR = "ee5932eb201590442fea3b32f670a01783d87544"
+
+def carregar_versao_anterior():
+    """Carrega paginas/funcoes.py de REVISAO_ANTERIOR como um módulo temporário."""
+    codigo = subprocess.run(
+        ["git", "show", f"{REVISAO_ANTERIOR}:paginas/funcoes.py"],
+        cwd=RAIZ, capture_output=True, text=True, encoding="utf-8", check=True
+    ).stdout
+    modulo = types.ModuleType("funcoes_anterior")
+    modulo.__file__ = f"<git {REVISAO_ANTERIOR[:7]}:paginas/funcoes.py>"
+    exec(compile(codigo, modulo.__file__, "exec"), modulo.__dict__)
+    return modulo
+
+PET = {
+    "id": "pet-benchmark",
+    "nome": "Thor",
+    "especie": "Cachorro",
+    "raca": "Labrador",
+    "sexo": "Macho",
+    "idade": 5,
+    "peso": 30,
+    "castrado": "Sim",
+    "url_foto": "https://storage.googleapis.com/exemplo/thor.jpg",
+    "saude": "Vacinas em dia. Alergia leve a frango.",
+    "alimentacao": "Ração premium duas vezes ao dia.",
+    "historia": "Adotado em 2020, muito brincalhão.",
+}
+
+def dados_ficticios(quantidade):
+    """Gera listas de exames e acontecimentos com a quantidade pedida."""
+    inicio = datetime(2024, 1, 1)
+    exames = [
+        {
+            "id": f"exame-{i}",
+            "nome_exame": ("Hemograma completo", "Raio-X do tórax", "Urina tipo 1", "Check-up")[i % 4],
+            "url_pdf": f"https://storage.googleapis.com/exemplo/exame_{i}.pdf",
+            "data_upload": inicio + timedelta(days=i),
+        }
+        for i in range(quantidade)
+    ]
+    acontecimentos = [
+        {
+            "id": f"acontecimento-{i}",
+            "data_hora": inicio + timedelta(days=i, hours=9),
+            "descricao": "Vomitou depois do passeio e ficou quieto o resto do dia.",
+            "url_foto": f"https://storage.googleapis.com/exemplo/foto_{i}.jpg" if i % 2 else "",
+        }
+        for i in range(quantidade)
+    ]
+    return exames, acontecimentos
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    
+    renderizadores = (
+        ("antes (f-string)", carregar_versao_anterior().gerar_relatorio_pet_html),
+        ("depois (templates)", gerar_relatorio_pet_html),
+    )
+    
+    # Primeira chamada fora da medição (leitura dos templates)
+    for _, renderizar in renderizadores:
+        renderizar(PET, "Check-up anual", [], [])
+    
+    print(f"{'':>28}" + "".join(f"{nome:>22}" for nome, _ in renderizadores))
+    for quantidade in (0, 10, 100):
+        exames, acontecimentos = dados_ficticios(quantidade)
+        tempos = []
+        for _, renderizar in renderizadores:
+            tempo = timeit.timeit(
+                lambda: renderizar(PET, "Check-up anual", exames, acontecimentos),
+                number=repeticoes
+            )
+            tempos.append(tempo / repeticoes * 1000)
+        print(f"{quantidade:>3} exames/acontecimentos:    " + "".join(f"{tempo:>19.3f} ms" for tempo in tempos))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import io
+import json
+import shutil
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from reportlab.pdfgen import canvas
+
+import paginas.agentes_funcoes as agentes_funcoes
+import paginas.funcoes as funcoes
+
+
+def _pdf(texto=None):
+    """Gera um PDF de uma página; sem texto, simula um laudo digitalizado."""
+    buffer = io.BytesIO()
+    pagina = canvas.Canvas(buffer)
+    if texto:
+        pagina.drawString(100, 700, texto)
+    else:
+        pagina.rect(100, 600, 200, 100, fill=1)
+    pagina.showPage()
+    pagina.save()
+    return buffer.getvalue()
+
+
+class TestCacheRelator(unittest.TestCase):
+
+    def setUp(self):
+        self.diretorio = tempfile.mkdtemp()
+        self.enderecos = [
+            mock.patch.object(funcoes, "CACHE_ARQUIVOS_DIRETORIO", self.diretorio),
+            mock.patch.object(agentes_funcoes, "obter_db", return_value=mock.MagicMock()),
+            mock.patch.object(agentes_funcoes, "registrar_resumo_exame"),
+        ]
+        for endereco in self.enderecos:
+            endereco.start()
+
+        # Cada chamada ao modelo devolve um resultado diferente
+        self.chamadas = []
+        def criar(**argumentos):
+            self.chamadas.append(argumentos)
+            saida = {
+                "data_exame": f"0{len(self.chamadas)}-01-2025",
+                "tipo_exame": f"Exame {len(self.chamadas)}",
+                "resultado_exame": "Normal",
+                "mini_relatorio": "-",
+            }
+            mensagem = types.SimpleNamespace(content=json.dumps(saida))
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(message=mensagem)])
+        cliente = mock.MagicMock()
+        cliente.chat.completions.create.side_effect = criar
+        self.enderecos.append(mock.patch.object(agentes_funcoes, "obter_cliente_openai", return_value=cliente))
+        self.enderecos[-1].start()
+
+    def tearDown(self):
+        for endereco in self.enderecos:
+            endereco.stop()
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+
+    def _analisar(self, pdf, exame_id):
+        with mock.patch.object(agentes_funcoes, "print", create=True):
+            return agentes_funcoes.relator("pet", exame_id, pdf=io.BytesIO(pdf), email="tutor@exemplo.com")
+
+    def test_pdfs_sem_texto_nao_compartilham_resultado(self):
+        self.assertTrue(self._analisar(_pdf(), "exame_1"))
+        self.assertTrue(self._analisar(_pdf(), "exame_2"))
+        self.assertEqual(len(self.chamadas), 2)
+
+    def test_mesmo_laudo_reaproveita_resultado(self):
+        pdf = _pdf("Hemograma completo - resultado normal")
+        self.assertTrue(self._analisar(pdf, "exame_1"))
+        self.assertTrue(self._analisar(pdf, "exame_2"))
+        self.assertEqual(len(self.chamadas), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()